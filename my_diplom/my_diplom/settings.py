@@ -224,3 +224,30 @@ CELERY_RESULT_BACKEND = 'redis://0.0.0.0:6379/0'
 CELERY_ACCEPT_CONTENT = ['application/json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
+
+# Import configuration
+IMPORT_BATCH_SIZE = 1000
+IMPORT_DOWNLOAD_CHUNK_SIZE = 64 * 1024
+IMPORT_SPOOL_MAX_SIZE = 8 * 1024 * 1024
+IMPORT_JOB_TIMEOUT = 60 * 60
+IMPORT_UPLOAD_DIR = BASE_DIR / 'uploads'
+IMPORT_LOCAL_ROOTS = [BASE_DIR.parent / 'data']
+
+# Export configuration
+EXPORT_CHUNK_SIZE = 2000
+
+# Response cache configuration
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'responses': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('RESPONSE_CACHE_URL', 'redis://0.0.0.0:6379/1'),
+    },
+}
+RESPONSE_CACHE_ALIAS = 'responses'
+RESPONSE_CACHE_TIMEOUT = 5 * 60
+RESPONSE_CACHE_STALE_TIMEOUT = 60 * 60
+RESPONSE_CACHE_LOCK_TIMEOUT = 30
+RESPONSE_CACHE_WAIT = 2
@@ -1,13 +1,22 @@
 from django.contrib import admin
+from django.db import transaction
 
 from orders.models import Order, OrderItem
 
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
-    list_display = ('user', 'dt', 'state',)
+    list_display = ('user', 'dt', 'state', 'item_count', 'total',)
+    readonly_fields = ('subtotal', 'item_count', 'total',)
 
 
 @admin.register(OrderItem)
 class OrderItemAdmin(admin.ModelAdmin):
     list_display = ('order', 'get_products', 'quantity',)
+
+    def delete_queryset(self, request, queryset):
+        # массовое удаление не вызывает OrderItem.delete, поэтому итоги пересчитываются здесь
+        with transaction.atomic():
+            order_ids = list(queryset.values_list('order_id', flat=True).distinct())
+            super().delete_queryset(request, queryset)
+            Order.objects.filter(id__in=order_ids).refresh_totals()
@@ -0,0 +1,128 @@
+from django.db import connection, transaction
+from django.db.models import Case, IntegerField, Value, When
+
+from orders.models import Order, OrderItem
+from shops.importer import batched
+from shops.models import ProductInfo
+from shops.serializers import decimal_to_string
+
+BASKET_BATCH_SIZE = 1000
+
+
+def positive_int(value):
+    """
+    Целое число больше нуля из числа или строки, иначе None
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, str) and value.isdigit():
+        value = int(value)
+    if isinstance(value, int) and value > 0:
+        return value
+    return None
+
+
+def parse_basket_items(items):
+    """
+    Проверяем позиции для добавления в корзину: [{"product_info": id, "quantity": n}, ...].
+    Все предложения проверяются одним запросом, повторы одного предложения складываются.
+    Возвращаем {id предложения: количество} и список ошибок
+    """
+    if not isinstance(items, list) or not items:
+        return {}, ['Ожидается непустой список позиций']
+
+    quantities = {}
+    errors = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            errors.append(f'Позиция {index}: неверный формат')
+            continue
+        product_info_id = positive_int(item.get('product_info'))
+        quantity = positive_int(item.get('quantity', 1))
+        if product_info_id is None or quantity is None:
+            errors.append(f'Позиция {index}: неправильно указаны product_info или quantity')
+            continue
+        quantities[product_info_id] = quantities.get(product_info_id, 0) + quantity
+
+    missing = set(quantities) - set(ProductInfo.objects.filter(id__in=quantities, is_active=True).values_list(
+        'id', flat=True))
+    errors.extend(f'Предложение {product_info_id} не найдено' for product_info_id in sorted(missing))
+    return quantities, errors
+
+
+def add_to_basket(order_id, quantities):
+    """
+    Добавляем позиции в корзину одним INSERT ... ON CONFLICT: если предложение
+    уже есть в корзине, его количество увеличивается, итоги корзины пересчитываются
+    в той же транзакции. Строки идут в порядке id предложений, чтобы параллельные
+    добавления блокировали их в одном порядке. Возвращаем число добавленных и измененных позиций
+    """
+    meta = OrderItem._meta
+    quote = connection.ops.quote_name
+    table = quote(meta.db_table)
+    order, product_info, quantity = (quote(meta.get_field(name).column)
+                                     for name in ('order', 'product_info', 'quantity'))
+    increment = f'{quantity} = {table}.{quantity} + EXCLUDED.{quantity}'
+    affected = 0
+    with transaction.atomic(), connection.cursor() as cursor:
+        for batch in batched(sorted(quantities.items()), BASKET_BATCH_SIZE):
+            values = ', '.join(['(%s, %s, %s)'] * len(batch))
+            cursor.execute(
+                f'INSERT INTO {table} ({order}, {product_info}, {quantity}) VALUES {values} '
+                f'ON CONFLICT ({order}, {product_info}) DO UPDATE SET {increment}',
+                [value for product_info_id, count in batch for value in (order_id, product_info_id, count)])
+            affected += cursor.rowcount
+        Order.objects.filter(id=order_id).refresh_totals()
+    return affected
+
+
+def parse_quantity_updates(items):
+    """
+    Проверяем новые количества позиций корзины: [{"id": id позиции, "quantity": n}, ...].
+    Количество 0 удаляет позицию. Возвращаем {id позиции: количество} и список ошибок
+    """
+    if not isinstance(items, list) or not items:
+        return {}, ['Ожидается непустой список позиций']
+
+    quantities = {}
+    errors = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            errors.append(f'Позиция {index}: неверный формат')
+            continue
+        item_id = positive_int(item.get('id'))
+        quantity = item.get('quantity')
+        quantity = 0 if quantity in (0, '0') else positive_int(quantity)
+        if item_id is None or quantity is None:
+            errors.append(f'Позиция {index}: неправильно указаны id или quantity')
+            continue
+        quantities[item_id] = quantity
+    return quantities, errors
+
+
+def update_basket(order_id, quantities):
+    """
+    Меняем количества позиций корзины в одной транзакции: позиции с количеством 0
+    удаляются одним DELETE, остальные обновляются одним UPDATE ... CASE, после чего
+    пересчитываются итоги корзины. Возвращаем число обновленных и удаленных позиций
+    и корзину с суммами по позициям в виде строк с копейками, как subtotal
+    """
+    removed = [item_id for item_id, quantity in quantities.items() if not quantity]
+    changed = {item_id: quantity for item_id, quantity in quantities.items() if quantity}
+    items = OrderItem.objects.filter(order_id=order_id)
+    updated = deleted = 0
+    with transaction.atomic():
+        if removed:
+            deleted = items.filter(id__in=removed).delete()[0]
+        if changed:
+            updated = items.filter(id__in=changed).update(quantity=Case(
+                *[When(id=item_id, then=Value(quantity)) for item_id, quantity in changed.items()],
+                output_field=IntegerField()))
+        Order.objects.filter(id=order_id).refresh_totals()
+        lines = list(items.order_by('id').values('id', 'product_info_id', 'quantity', 'product_info__price'))
+
+    amounts = [line['quantity'] * (line['product_info__price'] or 0) for line in lines]
+    order_items = [{'id': line['id'], 'product_info': line['product_info_id'], 'quantity': line['quantity'],
+                    'sum': decimal_to_string(amount)} for line, amount in zip(lines, amounts)]
+    return updated, deleted, {'order_items': order_items, 'item_count': sum(line['quantity'] for line in lines),
+                              'total_sum': decimal_to_string(sum(amounts))}
@@ -0,0 +1,44 @@
+# Generated by Django 4.1.5 on 2026-10-18 20:33
+
+from django.db import migrations, models
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_totals(apps, schema_editor):
+    # считаем итоги уже существующих заказов
+    Order = apps.get_model('orders', 'Order')
+    OrderItem = apps.get_model('orders', 'OrderItem')
+    lines = OrderItem.objects.filter(order_id=OuterRef('pk')).order_by().values('order_id')
+    amount = Subquery(lines.annotate(amount=Sum(F('quantity') * F('product_info__price'),
+                                                output_field=DecimalField())).values('amount'))
+    count = Subquery(lines.annotate(count=Sum('quantity')).values('count'))
+    zero = Value(0, output_field=DecimalField())
+    Order.objects.update(subtotal=Coalesce(amount, zero), item_count=Coalesce(count, 0),
+                         total=Coalesce(amount, zero))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0003_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Количество товаров'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='subtotal',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Сумма товаров'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Итого'),
+        ),
+        migrations.RunPython(fill_totals, migrations.RunPython.noop),
+    ]
@@ -1,9 +1,34 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
 from my_diplom import settings
 from shops.models import ProductInfo
 from users.models import Contact
 
 
+def order_totals():
+    """
+    Выражения для хранимых итогов заказа по его позициям и текущим ценам,
+    подставляются в UPDATE заказов
+    """
+    lines = OrderItem.objects.filter(order_id=OuterRef('pk')).order_by().values('order_id')
+    amount = Subquery(lines.annotate(amount=Sum(F('quantity') * F('product_info__price'),
+                                                output_field=DecimalField())).values('amount'))
+    count = Subquery(lines.annotate(count=Sum('quantity')).values('count'))
+    zero = Value(0, output_field=DecimalField())
+    return {'subtotal': Coalesce(amount, zero), 'item_count': Coalesce(count, 0), 'total': Coalesce(amount, zero)}
+
+
+class OrderQuerySet(models.QuerySet):
+    def refresh_totals(self):
+        """
+        Пересчитываем хранимые суммы и количество товаров выбранных заказов одним UPDATE.
+        Вызывается в той же транзакции, в которой меняются позиции
+        """
+        return self.update(**order_totals())
+
+
 class Order(models.Model):
     STATUS_CHOICES = (
         ('new', 'Новый'),
@@ -33,6 +58,12 @@ class Order(models.Model):
         blank=True, null=True,
         on_delete=models.CASCADE
     )
+    # хранимые итоги заказа, пересчитываются при каждом изменении позиций
+    subtotal = models.DecimalField(verbose_name='Сумма товаров', max_digits=12, decimal_places=2, default=0)
+    item_count = models.PositiveIntegerField(verbose_name='Количество товаров', default=0)
+    total = models.DecimalField(verbose_name='Итого', max_digits=12, decimal_places=2, default=0)
+
+    objects = OrderQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Заказ'
@@ -68,6 +99,17 @@ class OrderItem(models.Model):
 
     get_products.short_description = 'Продукты'
 
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            Order.objects.filter(id=self.order_id).refresh_totals()
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            Order.objects.filter(id=self.order_id).refresh_totals()
+        return result
+
     class Meta:
         verbose_name = 'Заказанный товар'
         verbose_name_plural = 'Список заказанных товаров'
@@ -1,6 +1,6 @@
 from rest_framework import serializers
 from orders.models import OrderItem, Order
-from shops.serializers import ProductInfoSerializer
+from shops.serializers import EXPANSIONS, ProductInfoSerializer, decimal_to_string, serialize_product_infos
 from users.serializers import ContactSerializer
 
 
@@ -20,11 +20,65 @@ class OrderItemCreateSerializer(OrderItemSerializer):
 
 class OrderSerializer(serializers.ModelSerializer):
     order_items = OrderItemCreateSerializer(read_only=True, many=True)
-    total_sum = serializers.IntegerField()
+    total_sum = serializers.DecimalField(source='total', max_digits=12, decimal_places=2, read_only=True)
     contact = ContactSerializer(read_only=True)
 
     class Meta:
         model = Order
-        fields = '__all__'
+        exclude = ('total',)
         read_only_fields = ('id',)
 
+
+CONTACT_FIELDS = ('id', 'city', 'street', 'house', 'apartment', 'phone')
+# поля заказа в ответе, id есть всегда
+ORDER_FIELDS = ('order_items', 'subtotal', 'item_count', 'total_sum', 'contact', 'dt', 'state', 'user')
+datetime_field = serializers.DateTimeField()
+
+
+def serialize_orders(queryset, fields=ORDER_FIELDS, expand=EXPANSIONS):
+    """
+    Быстрая сериализация заказов в виде OrderSerializer из values():
+    запрос заказов, запрос позиций и до двух запросов предложений.
+    Итоги берутся из хранимых колонок заказа.
+    Позиции и контакт читаются, только если они есть в fields
+    """
+    columns = ['id']
+    columns.extend(field for field in ('subtotal', 'item_count') if field in fields)
+    if 'total_sum' in fields:
+        columns.append('total')
+    if 'contact' in fields:
+        columns.extend(['contact_id', *[f'contact__{field}' for field in CONTACT_FIELDS]])
+    columns.extend(field if field != 'user' else 'user_id' for field in ('dt', 'state', 'user') if field in fields)
+    orders = list(queryset.values(*columns))
+
+    items = {}
+    if 'order_items' in fields:
+        for row in OrderItem.objects.filter(order_id__in=[order['id'] for order in orders]).order_by('id').values(
+                'id', 'order_id', 'product_info_id', 'quantity'):
+            items.setdefault(row['order_id'], []).append(row)
+    product_infos = serialize_product_infos({row['product_info_id'] for rows in items.values() for row in rows},
+                                            expand=expand) if items else {}
+
+    result = []
+    for order in orders:
+        item = {'id': order['id']}
+        if 'order_items' in fields:
+            item['order_items'] = [{'id': row['id'], 'product_info': product_infos.get(row['product_info_id']),
+                                    'quantity': row['quantity']} for row in items.get(order['id'], [])]
+        if 'subtotal' in fields:
+            item['subtotal'] = decimal_to_string(order['subtotal'])
+        if 'item_count' in fields:
+            item['item_count'] = order['item_count']
+        if 'total_sum' in fields:
+            item['total_sum'] = decimal_to_string(order['total'])
+        if 'contact' in fields:
+            item['contact'] = None if order['contact_id'] is None else {
+                field: order[f'contact__{field}'] for field in CONTACT_FIELDS}
+        if 'dt' in fields:
+            item['dt'] = datetime_field.to_representation(order['dt'])
+        if 'state' in fields:
+            item['state'] = order['state']
+        if 'user' in fields:
+            item['user'] = order['user_id']
+        result.append(item)
+    return result
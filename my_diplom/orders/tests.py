@@ -1,3 +1,153 @@
-from django.test import TestCase
+import json
+from decimal import Decimal
 
-# Create your tests here.
+from orders.models import Order, OrderItem
+from orders.serializers import OrderSerializer
+from shops.models import ProductInfo
+from shops.tests import QueryBudgetTestCase
+from users.models import Contact
+
+
+class OrdersQueryBudgetTest(QueryBudgetTestCase):
+    """
+    Бюджет запросов для корзины и заказов
+    """
+    def basket(self):
+        return Order.objects.get(user=self.buyer, state='basket')
+
+    def test_basket(self):
+        self.assertBudget('get', '/api/v1/basket', 4, max_size=3000, user=self.buyer)
+
+    def test_basket_sparse_fields(self):
+        self.assertBudget('get', '/api/v1/basket?fields=total_sum,state', 1, max_size=100, user=self.buyer)
+
+    def test_basket_add(self):
+        def prepare(scale):
+            # число позиций растет вместе с данными, а число запросов - нет
+            OrderItem.objects.filter(order=self.basket()).delete()
+            product_infos = ProductInfo.objects.filter(shop__user=self.partner).order_by('id')[:scale]
+            return {'items': json.dumps([{'product_info': product_info.id, 'quantity': 3}
+                                         for product_info in product_infos])}
+
+        self.assertBudget('post', '/api/v1/basket', 6, max_size=200, user=self.buyer, prepare=prepare,
+                          format='json')
+
+    def test_basket_add_existing(self):
+        def prepare(scale):
+            return {'items': json.dumps([{'product_info': product_info_id, 'quantity': 1} for product_info_id in
+                                         self.basket().order_items.values_list('product_info_id', flat=True)])}
+
+        self.assertBudget('post', '/api/v1/basket', 6, max_size=200, user=self.buyer, prepare=prepare,
+                          format='json')
+        # повторное добавление увеличивает количество, а не падает на unique_order_item:
+        # в корзине было по 2 штуки, и каждое предложение добавлено еще два раза по одной
+        quantities = list(self.basket().order_items.values_list('quantity', flat=True))
+        self.assertEqual(quantities, [4] * self.items)
+
+    def test_basket_add_unknown(self):
+        self.seed(self.scales[0])
+        response, queries, _ = self.call('post', '/api/v1/basket', user=self.buyer, format='json',
+                                         data={'items': json.dumps([{'product_info': 10 ** 9, 'quantity': 1}])})
+        self.assertFalse(json.loads(response.content)['Status'])
+        self.assertEqual(self.basket().order_items.count(), self.items)
+
+    def test_basket_update(self):
+        def prepare(scale):
+            # в корзине scale позиций: первая удаляется, остальные меняют количество
+            basket = self.basket()
+            OrderItem.objects.bulk_create([OrderItem(order=basket, product_info=product_info) for product_info in
+                                           ProductInfo.objects.filter(shop__user=self.partner)[:scale]],
+                                          ignore_conflicts=True)
+            item_ids = list(basket.order_items.order_by('id').values_list('id', flat=True))
+            return {'items': json.dumps([{'id': item_id, 'quantity': 0 if index == 0 else 4}
+                                         for index, item_id in enumerate(item_ids)])}
+
+        self.assertBudget('put', '/api/v1/basket', 7, user=self.buyer, prepare=prepare, format='json')
+        quantities = list(self.basket().order_items.values_list('quantity', flat=True))
+        self.assertEqual(quantities, [4] * (self.scales[-1] - 1))
+
+    def test_basket_update_amounts(self):
+        self.seed(self.scales[0])
+        items = list(self.basket().order_items.order_by('id').values_list('id', 'product_info_id'))
+        ProductInfo.objects.filter(id=items[1][1]).update(price=Decimal('199.99'))
+        data = {'items': json.dumps([{'id': items[0][0], 'quantity': 0}, {'id': items[1][0], 'quantity': 3}])}
+        response, _, _ = self.call('put', '/api/v1/basket', user=self.buyer, data=data, format='json')
+        body = json.loads(response.content)
+        self.assertEqual((body['Обновлено объектов'], body['Удалено объектов']), (1, 1))
+        self.assertEqual(len(body['order_items']), self.items - 1)
+        line = body['order_items'][0]
+        self.assertEqual((line['id'], line['quantity'], line['sum']), (items[1][0], 3, '599.97'))
+        # копейки не отбрасываются
+        self.assertEqual(Decimal(body['total_sum']), sum(Decimal(item['sum']) for item in body['order_items']))
+        # итог корзины отдается одной и той же строкой при изменении и при чтении
+        response, _, _ = self.call('get', '/api/v1/basket?fields=total_sum', user=self.buyer)
+        self.assertEqual(json.loads(response.content)[0]['total_sum'], body['total_sum'])
+        self.assertEqual(OrderSerializer(self.basket()).data['total_sum'], body['total_sum'])
+
+    def test_basket_delete(self):
+        def prepare(scale):
+            item_ids = OrderItem.objects.filter(order=self.basket()).values_list('id', flat=True)
+            return {'items': ','.join(str(item_id) for item_id in item_ids)}
+
+        self.assertBudget('delete', '/api/v1/basket', 5, max_size=200, user=self.buyer, prepare=prepare,
+                          format='json')
+
+    def test_orders(self):
+        self.assertBudget('get', '/api/v1/order', 4, max_size=8000, user=self.buyer)
+
+    def test_order_create(self):
+        def prepare(scale):
+            return {'id': str(self.basket().id), 'contact': Contact.objects.filter(user=self.buyer).first().id}
+
+        self.assertBudget('post', '/api/v1/order', 2, max_size=100, user=self.buyer, prepare=prepare,
+                          format='json')
+
+    def test_order_create_refreshes_totals(self):
+        self.seed(self.scales[0])
+        basket = self.basket()
+        # цену поменяли в обход пересчета итогов корзины
+        ProductInfo.objects.filter(id__in=basket.order_items.values('product_info')).update(price=Decimal('10.50'))
+        contact = Contact.objects.filter(user=self.buyer).first()
+        response, _, _ = self.call('post', '/api/v1/order', user=self.buyer, format='json',
+                                   data={'id': str(basket.id), 'contact': contact.id})
+        self.assertTrue(json.loads(response.content)['Status'])
+        order = Order.objects.get(id=basket.id)
+        self.assertEqual((order.state, order.item_count), ('new', 2 * self.items))
+        self.assertEqual(order.total, Decimal('10.50') * 2 * self.items)
+
+        # оформленный заказ повторно не оформляется и не переоценивается
+        ProductInfo.objects.filter(id__in=order.order_items.values('product_info')).update(price=1)
+        response, _, _ = self.call('post', '/api/v1/order', user=self.buyer, format='json',
+                                   data={'id': str(order.id), 'contact': contact.id})
+        self.assertFalse(json.loads(response.content)['Status'])
+        self.assertEqual(Order.objects.get(id=order.id).total, order.total)
+
+    def test_partner_orders(self):
+        self.assertBudget('get', '/api/v1/partner/orders', 4, max_size=8000, user=self.partner)
+
+    def test_stored_totals(self):
+        self.seed(self.scales[0])
+        basket = self.basket()
+        product_infos = ProductInfo.objects.filter(shop__user=self.partner).order_by('id')
+        item_ids = list(basket.order_items.order_by('id').values_list('id', flat=True))
+        requests = [
+            ('post', {'items': json.dumps([{'product_info': product_infos[0].id, 'quantity': 2},
+                                           {'product_info': product_infos[self.items].id, 'quantity': 1}])}),
+            ('put', {'items': json.dumps([{'id': item_ids[1], 'quantity': 0}, {'id': item_ids[2], 'quantity': 7}])}),
+            ('delete', {'items': str(item_ids[3])}),
+        ]
+        for method, data in requests:
+            self.call(method, '/api/v1/basket', user=self.buyer, data=data, format='json')
+            # хранимые итоги совпадают с суммой по позициям
+            basket.refresh_from_db()
+            lines = list(basket.order_items.values_list('quantity', 'product_info__price'))
+            self.assertEqual(basket.item_count, sum(quantity for quantity, _ in lines), method)
+            self.assertEqual(basket.total, sum(quantity * price for quantity, price in lines), method)
+            self.assertEqual(basket.subtotal, basket.total, method)
+
+        # после импорта с новыми ценами итоги корзины пересчитываются
+        ProductInfo.objects.filter(id=product_infos[0].id).update(price=1)
+        self.seed(self.scales[0])
+        basket.refresh_from_db()
+        self.assertEqual(basket.total, sum(quantity * price for quantity, price in
+                                           basket.order_items.values_list('quantity', 'product_info__price')))
@@ -1,13 +1,15 @@
-from django.db.models import Q, Sum, F
+from django.db.models import Q
 from django.http import JsonResponse
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
 
 from ujson import loads as load_json
 
-from orders.models import Order, OrderItem
-from orders.serializers import OrderSerializer, OrderItemSerializer
+from orders.basket import add_to_basket, parse_basket_items, parse_quantity_updates, update_basket
+from orders.models import Order, OrderItem, order_totals
+from orders.serializers import ORDER_FIELDS, serialize_orders
+from shops.serializers import parse_fieldset
 from my_diplom.celery import send_email
 from users.models import User
 
@@ -20,14 +22,14 @@ class BasketView(APIView):
     def get(self, request, *args, **kwargs):
         if not request.user.is_authenticated:
             return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
-        basket = Order.objects.filter(
-            user_id=request.user.id, state='basket').prefetch_related(
-            'order_items__product_info__product__category',
-            'order_items__product_info__product_parameters__parameter').annotate(
-            total_sum=Sum(F('order_items__quantity') * F('order_items__product_info__price'))).distinct()
+        # итоги хранятся в заказе, поэтому список читается без join'а и группировки
+        basket = Order.objects.filter(user_id=request.user.id, state='basket')
 
-        serializer = OrderSerializer(basket, many=True)
-        return Response(serializer.data)
+        try:
+            fields, expand = parse_fieldset(request.query_params, ORDER_FIELDS)
+        except ValueError as error:
+            return JsonResponse({'Status': False, 'Errors': str(error)})
+        return Response(serialize_orders(basket, fields, expand))
 
     # добавление товара в корзину
     def post(self, request, *args, **kwargs):
@@ -37,28 +39,17 @@ class BasketView(APIView):
         items_sting = request.data.get('items')
         if items_sting:
             try:
-                items_dict = load_json(items_sting)
+                items = load_json(items_sting) if isinstance(items_sting, str) else items_sting
             except ValueError:
-                JsonResponse({'Status': False, 'Errors': 'Неверный формат запроса'})
-            else:
-                basket, _ = Order.objects.get_or_create(user_id=request.user.id, state='basket')
-                objects_created = 0
-                for order_item in items_dict:
-                    order_item.update({'order': basket.id})
-                    serializer = OrderItemSerializer(data=order_item)
-                    if serializer.is_valid():
-                        try:
-                            serializer.save()
-                        except IntegrityError as error:
-                            return JsonResponse({'Status': False, 'Errors': str(error)})
-                        else:
-                            objects_created += 1
-
-                    else:
-
-                        JsonResponse({'Status': False, 'Errors': serializer.errors})
-
-                return JsonResponse({'Status': True, 'Создано объектов': objects_created})
+                return JsonResponse({'Status': False, 'Errors': 'Неверный формат запроса'})
+
+            # все предложения проверяются одним запросом, позиции добавляются одним upsert
+            quantities, errors = parse_basket_items(items)
+            if errors:
+                return JsonResponse({'Status': False, 'Errors': errors})
+            basket, _ = Order.objects.get_or_create(user_id=request.user.id, state='basket')
+            objects_created = add_to_basket(basket.id, quantities)
+            return JsonResponse({'Status': True, 'Создано объектов': objects_created})
         return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
 
     # изменить позиции в корзине
@@ -69,18 +60,18 @@ class BasketView(APIView):
         items_sting = request.data.get('items')
         if items_sting:
             try:
-                items_dict = load_json(items_sting)
+                items = load_json(items_sting) if isinstance(items_sting, str) else items_sting
             except ValueError:
-                JsonResponse({'Status': False, 'Errors': 'Неверный формат запроса'})
-            else:
-                basket, _ = Order.objects.get_or_create(user_id=request.user.id, state='basket')
-                objects_updated = 0
-                for order_item in items_dict:
-                    if type(order_item['id']) == int and type(order_item['quantity']) == int:
-                        objects_updated += OrderItem.objects.filter(order_id=basket.id, id=order_item['id']).update(
-                            quantity=order_item['quantity'])
-
-                return JsonResponse({'Status': True, 'Обновлено объектов': objects_updated})
+                return JsonResponse({'Status': False, 'Errors': 'Неверный формат запроса'})
+
+            # количество 0 удаляет позицию, остальные обновляются одним UPDATE
+            quantities, errors = parse_quantity_updates(items)
+            if errors:
+                return JsonResponse({'Status': False, 'Errors': errors})
+            basket, _ = Order.objects.get_or_create(user_id=request.user.id, state='basket')
+            objects_updated, objects_deleted, data = update_basket(basket.id, quantities)
+            return JsonResponse({'Status': True, 'Обновлено объектов': objects_updated,
+                                 'Удалено объектов': objects_deleted, **data})
         return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
 
     # удалить товары из корзины
@@ -100,7 +91,9 @@ class BasketView(APIView):
                     objects_deleted = True
 
             if objects_deleted:
-                deleted_count = OrderItem.objects.filter(query).delete()[0]
+                with transaction.atomic():
+                    deleted_count = OrderItem.objects.filter(query).delete()[0]
+                    Order.objects.filter(id=basket.id).refresh_totals()
                 return JsonResponse({'Status': True, 'Удалено объектов': deleted_count})
         return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
 
@@ -113,14 +106,13 @@ class OrderView(APIView):
     def get(self, request, *args, **kwargs):
         if not request.user.is_authenticated:
             return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
-        order = Order.objects.filter(
-            user_id=request.user.id).exclude(state='basket').prefetch_related(
-            'order_items__product_info__product__category',
-            'order_items__product_info__product_parameters__parameter').select_related('contact').annotate(
-            total_sum=Sum(F('order_items__quantity') * F('order_items__product_info__price'))).distinct()
+        order = Order.objects.filter(user_id=request.user.id).exclude(state='basket')
 
-        serializer = OrderSerializer(order, many=True)
-        return Response(serializer.data)
+        try:
+            fields, expand = parse_fieldset(request.query_params, ORDER_FIELDS)
+        except ValueError as error:
+            return JsonResponse({'Status': False, 'Errors': str(error)})
+        return Response(serialize_orders(order, fields, expand))
 
     # разместить заказ из корзины
     def post(self, request, *args, **kwargs):
@@ -130,10 +122,12 @@ class OrderView(APIView):
         if {'id', 'contact'}.issubset(request.data):
             if request.data['id'].isdigit():
                 try:
+                    # оформляется только корзина, итоги фиксируются по текущим ценам
+                    # тем же UPDATE, что меняет статус
                     is_updated = Order.objects.filter(
-                        user_id=request.user.id, id=request.data['id']).update(
+                        user_id=request.user.id, id=request.data['id'], state='basket').update(
                         contact_id=request.data['contact'],
-                        state='new')
+                        state='new', **order_totals())
                 except IntegrityError as error:
                     return JsonResponse({'Status': False, 'Errors': 'Неправильно указаны аргументы'})
                 else:
@@ -160,11 +154,12 @@ class PartnerOrders(APIView):
         if request.user.type != 'shop':
             return JsonResponse({'Status': False, 'Error': 'Только для магазинов'}, status=403)
 
-        order = Order.objects.filter(
-            order_items__product_info__shop__user_id=request.user.id).exclude(state='basket').prefetch_related(
-            'order_items__product_info__product__category',
-            'order_items__product_info__product_parameters__parameter').select_related('contact').annotate(
-            total_sum=Sum(F('order_items__quantity') * F('order_items__product_info__price'))).distinct()
+        # заказы с товарами магазина отбираются подзапросом, без дублей и distinct
+        order = Order.objects.filter(id__in=OrderItem.objects.filter(
+            product_info__shop__user_id=request.user.id).values('order_id')).exclude(state='basket')
 
-        serializer = OrderSerializer(order, many=True)
-        return Response(serializer.data)
+        try:
+            fields, expand = parse_fieldset(request.query_params, ORDER_FIELDS)
+        except ValueError as error:
+            return JsonResponse({'Status': False, 'Errors': str(error)})
+        return Response(serialize_orders(order, fields, expand))
@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from shops.models import Shop, Category, Product, ProductInfo, Parameter, ProductParameter
+from shops.models import Shop, Category, Product, ProductInfo, Parameter, ProductParameter, Facet, ImportJob
 
 
 @admin.register(Shop)
@@ -20,7 +20,7 @@ class ProductAdmin(admin.ModelAdmin):
 
 @admin.register(ProductInfo)
 class ProductInfoAdmin(admin.ModelAdmin):
-    list_display = ('name', 'quantity', 'price', 'price_rrc', 'product', 'shop',)
+    list_display = ('name', 'external_id', 'quantity', 'price', 'price_rrc', 'product', 'shop',)
 
 
 @admin.register(Parameter)
@@ -31,3 +31,13 @@ class ParameterAdmin(admin.ModelAdmin):
 @admin.register(ProductParameter)
 class ProductParameterAdmin(admin.ModelAdmin):
     list_display = ('product_info', 'parameter', 'value',)
+
+
+@admin.register(Facet)
+class FacetAdmin(admin.ModelAdmin):
+    list_display = ('shop', 'category', 'parameter', 'value', 'count',)
+
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = ('user', 'url', 'state', 'goods', 'rows_per_sec', 'created_at',)
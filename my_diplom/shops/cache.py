@@ -0,0 +1,192 @@
+import logging
+from functools import wraps
+from hashlib import sha1
+from math import log
+from random import random
+from time import monotonic, perf_counter, sleep, time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.response import Response
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_ALIAS = getattr(settings, 'RESPONSE_CACHE_ALIAS', 'default')
+RESPONSE_CACHE_TIMEOUT = getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 5 * 60)
+# сколько хранится прошлое значение ответа, которое отдается на время пересчета
+RESPONSE_CACHE_STALE_TIMEOUT = getattr(settings, 'RESPONSE_CACHE_STALE_TIMEOUT', 60 * 60)
+RESPONSE_CACHE_LOCK_TIMEOUT = getattr(settings, 'RESPONSE_CACHE_LOCK_TIMEOUT', 30)
+RESPONSE_CACHE_WAIT = getattr(settings, 'RESPONSE_CACHE_WAIT', 2)
+RESPONSE_CACHE_BETA = getattr(settings, 'RESPONSE_CACHE_BETA', 1.0)
+
+# разделы кэша: ответы раздела сбрасываются вместе увеличением его поколения
+SCOPES = ('products', 'categories', 'shops')
+
+
+def get_cache():
+    return caches[RESPONSE_CACHE_ALIAS]
+
+
+def get_generation(scope):
+    """
+    Текущее поколение раздела, входит в ключ каждого ответа раздела
+    """
+    cache = get_cache()
+    key = f'response:generation:{scope}'
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, 1, timeout=None)
+        generation = cache.get(key, 1)
+    return generation
+
+
+def bump_generation(*scopes):
+    """
+    Сбрасываем закэшированные ответы разделов: старые ключи больше не читаются
+    и вытесняются по времени жизни. Вызывается после фиксации импорта, поэтому
+    недоступный кэш только записывается в лог: ответы устареют по времени жизни
+    """
+    cache = get_cache()
+    for scope in scopes:
+        key = f'response:generation:{scope}'
+        try:
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.add(key, 2, timeout=None)
+        except Exception:
+            logger.exception('Не удалось сбросить кэш ответов раздела %s', scope)
+
+
+def count(scope, result):
+    cache = get_cache()
+    key = f'response:count:{result}:{scope}'
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def response_key(scope, request):
+    """
+    Ключ ответа: поколение раздела, адрес и параметры запроса в порядке сортировки
+    """
+    query = urlencode(sorted((name, value) for name, values in request.query_params.lists()
+                             for value in values))
+    digest = sha1(f'{request.get_host()}{request.path}?{query}'.encode()).hexdigest()
+    return f'response:{scope}:{get_generation(scope)}:{digest}'
+
+
+def should_refresh(entry, now):
+    """
+    Вероятностное раннее обновление (XFetch): чем ближе истечение записи и чем дольше
+    она вычислялась, тем выше шанс, что очередной запрос пересчитает ее заранее
+    """
+    return now - entry['delta'] * RESPONSE_CACHE_BETA * log(1.0 - random()) >= entry['expires']
+
+
+def wait_for(key):
+    """
+    Ждем, пока ответ посчитает запрос, захвативший блокировку
+    """
+    cache = get_cache()
+    deadline = monotonic() + RESPONSE_CACHE_WAIT
+    while monotonic() < deadline:
+        sleep(0.05)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry
+    return None
+
+
+def lookup(scope, request):
+    """
+    Ищем ответ в кэше. Возвращаем готовый Response при попадании,
+    иначе ключи ответа и признак захваченной блокировки для его расчета
+    """
+    cache = get_cache()
+    key = response_key(scope, request)
+    stale_key = f'response:stale:{scope}:{key.rsplit(":", 1)[1]}'
+    entry = cache.get(key)
+    if entry is not None and not should_refresh(entry, time()):
+        count(scope, 'hits')
+        return Response(entry['data'])
+
+    locked = cache.add(f'{key}:lock', 1, timeout=RESPONSE_CACHE_LOCK_TIMEOUT)
+    if not locked:
+        # ответ уже считает другой запрос
+        if entry is not None:
+            count(scope, 'hits')
+            return Response(entry['data'])
+        stale = cache.get(stale_key)
+        if stale is not None:
+            count(scope, 'stale')
+            return Response(stale['data'])
+        entry = wait_for(key)
+        if entry is not None:
+            count(scope, 'hits')
+            return Response(entry['data'])
+
+    count(scope, 'misses')
+    return key, stale_key, locked
+
+
+def cached_response(scope):
+    """
+    Декоратор метода представления: кэшируем данные успешного ответа DRF.
+    При промахе ответ считает только один запрос (single flight), остальные
+    получают прошлое значение или ждут результата.
+    Если кэш недоступен, ошибка пишется в лог, а ответ считается без кэша.
+    Аутентификация и ограничение частоты запросов выполняются до него
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            try:
+                cached = lookup(scope, request)
+            except Exception:
+                logger.exception('Кэш ответов раздела %s недоступен', scope)
+                return method(self, request, *args, **kwargs)
+            if isinstance(cached, Response):
+                return cached
+
+            key, stale_key, locked = cached
+            try:
+                started = perf_counter()
+                response = method(self, request, *args, **kwargs)
+                if isinstance(response, Response) and response.status_code == 200:
+                    entry = {'data': response.data, 'delta': perf_counter() - started,
+                             'expires': time() + RESPONSE_CACHE_TIMEOUT}
+                    try:
+                        cache = get_cache()
+                        cache.set(key, entry, timeout=RESPONSE_CACHE_TIMEOUT)
+                        cache.set(stale_key, entry, timeout=RESPONSE_CACHE_STALE_TIMEOUT)
+                    except Exception:
+                        logger.exception('Не удалось сохранить ответ раздела %s в кэш', scope)
+            finally:
+                if locked:
+                    try:
+                        get_cache().delete(f'{key}:lock')
+                    except Exception:
+                        logger.exception('Не удалось снять блокировку ответа раздела %s', scope)
+            return response
+        return wrapper
+    return decorator
+
+
+def cache_stats():
+    """
+    Попадания и промахи кэша ответов по разделам
+    """
+    cache = get_cache()
+    stats = {}
+    for scope in SCOPES:
+        hits = cache.get(f'response:count:hits:{scope}', 0)
+        misses = cache.get(f'response:count:misses:{scope}', 0)
+        stale = cache.get(f'response:count:stale:{scope}', 0)
+        total = hits + misses + stale
+        stats[scope] = {'hits': hits, 'misses': misses, 'stale': stale, 'generation': get_generation(scope),
+                        'hit_rate': round((hits + stale) / total, 3) if total else 0.0}
+    return stats
@@ -0,0 +1,66 @@
+from django.db import transaction
+
+from shops.cache import bump_generation
+from shops.models import CatalogEntry, ProductInfo, ProductParameter, Shop
+from shops.search import update_search_vectors
+
+# поля записи каталога, которые перезаписываются при обновлении
+ENTRY_FIELDS = ('shop', 'shop_name', 'shop_state', 'category', 'category_name', 'product', 'product_name',
+                'external_id', 'name', 'quantity', 'price', 'price_rrc', 'parameters')
+
+
+def refresh_catalog(product_info_ids, batch_size=1000):
+    """
+    Пересобираем записи каталога для выбранных предложений, снятые с продажи пропускаются:
+    два запроса на чтение, один upsert и пересчет поискового вектора на пакет
+    """
+    product_info_ids = list(product_info_ids)
+    for start in range(0, len(product_info_ids), batch_size):
+        ids = product_info_ids[start:start + batch_size]
+        parameters = {}
+        for row in ProductParameter.objects.filter(product_info_id__in=ids).values(
+                'product_info_id', 'parameter__name', 'value').order_by('id'):
+            parameters.setdefault(row['product_info_id'], []).append(
+                {'parameter': row['parameter__name'], 'value': row['value']})
+
+        entries = [CatalogEntry(product_info_id=row['id'], shop_id=row['shop_id'], shop_name=row['shop__name'],
+                                shop_state=row['shop__state'], category_id=row['product__category_id'],
+                                category_name=row['product__category__name'], product_id=row['product_id'],
+                                product_name=row['product__name'], external_id=row['external_id'],
+                                name=row['name'], quantity=row['quantity'], price=row['price'],
+                                price_rrc=row['price_rrc'], parameters=parameters.get(row['id'], []))
+                   for row in ProductInfo.objects.filter(id__in=ids, is_active=True).values(
+                       'id', 'shop_id', 'shop__name', 'shop__state', 'product__category_id',
+                       'product__category__name', 'product_id', 'product__name', 'external_id', 'name',
+                       'quantity', 'price', 'price_rrc')]
+        CatalogEntry.objects.bulk_create(entries, update_conflicts=True, unique_fields=['product_info'],
+                                         update_fields=ENTRY_FIELDS)
+        update_search_vectors(CatalogEntry.objects.filter(product_info_id__in=ids))
+
+
+def refresh_category_names(categories):
+    """
+    Переименовываем категории в каталоге, меняются только устаревшие записи
+    """
+    for category in categories:
+        CatalogEntry.objects.filter(category_id=category['id']).exclude(
+            category_name=category['name']).update(category_name=category['name'])
+
+
+def set_shop_state(user_id, state):
+    """
+    Меняем статус магазина вместе с его записями в каталоге
+    """
+    with transaction.atomic():
+        Shop.objects.filter(user_id=user_id).update(state=state)
+        CatalogEntry.objects.filter(shop__user_id=user_id).update(shop_state=state)
+        transaction.on_commit(lambda: bump_generation('shops'))
+
+
+def rebuild_catalog():
+    """
+    Полностью пересобираем каталог из предложений
+    """
+    with transaction.atomic():
+        CatalogEntry.objects.all().delete()
+        refresh_catalog(ProductInfo.objects.filter(is_active=True).order_by('id').values_list('id', flat=True))
@@ -0,0 +1,91 @@
+import csv
+import json
+import zlib
+
+from django.conf import settings
+
+from shops.importer import batched
+from shops.models import CatalogEntry
+from shops.serializers import CATALOG_FIELDS, decimal_to_string, serialize_catalog_rows
+
+EXPORT_CHUNK_SIZE = getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+# первый пакет маленький, чтобы клиент сразу получил первые байты
+EXPORT_FIRST_CHUNK_SIZE = 100
+EXPORT_FORMATS = ('jsonl', 'csv')
+EXPORT_CONTENT_TYPES = {'jsonl': 'application/x-ndjson', 'csv': 'text/csv; charset=utf-8'}
+CSV_HEADER = ('id', 'shop_id', 'shop', 'category_id', 'category', 'product_id', 'product', 'external_id', 'name',
+              'quantity', 'price', 'price_rrc', 'parameters')
+CSV_COLUMNS = ('pk', 'shop_id', 'shop_name', 'category_id', 'category_name', 'product_id', 'product_name',
+               'external_id', 'name', 'quantity', 'price', 'price_rrc', 'parameters')
+
+
+class Echo:
+    """
+    Файловый объект для csv.writer, который возвращает строку вместо записи
+    """
+    def write(self, value):
+        return value
+
+
+def export_batches(rows, chunk_size):
+    """
+    Разбиваем строки на пакеты: первый - маленький, остальные по chunk_size
+    """
+    first = []
+    for row in rows:
+        first.append(row)
+        if len(first) >= min(EXPORT_FIRST_CHUNK_SIZE, chunk_size):
+            break
+    if first:
+        yield first
+    yield from batched(rows, chunk_size)
+
+
+def export_queryset(shop_id=None, category_id=None):
+    queryset = CatalogEntry.objects.order_by('pk')
+    if shop_id:
+        queryset = queryset.filter(shop_id=shop_id)
+    if category_id:
+        queryset = queryset.filter(category_id=category_id)
+    return queryset
+
+
+def jsonl_chunks(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Каталог в JSON Lines: по строке на предложение в том же виде, что и в /products.
+    Строки читаются серверным курсором пакетами по chunk_size
+    """
+    rows = queryset.values(*CATALOG_FIELDS).iterator(chunk_size=chunk_size)
+    for batch in export_batches(rows, chunk_size):
+        yield ''.join(json.dumps(item, ensure_ascii=False) + '\n' for item in serialize_catalog_rows(batch))
+
+
+def csv_chunks(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Каталог в CSV, параметры - одной колонкой в JSON
+    """
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_HEADER)
+    rows = queryset.values_list(*CSV_COLUMNS).iterator(chunk_size=chunk_size)
+    for batch in export_batches(rows, chunk_size):
+        yield ''.join(writer.writerow((*row[:10], decimal_to_string(row[10]), decimal_to_string(row[11]),
+                                       json.dumps(row[12], ensure_ascii=False))) for row in batch)
+
+
+def export_chunks(feed_format, queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    if feed_format not in EXPORT_FORMATS:
+        raise ValueError(f'Неизвестный формат выгрузки: {feed_format}')
+    chunks = jsonl_chunks if feed_format == 'jsonl' else csv_chunks
+    for chunk in chunks(queryset, chunk_size):
+        yield chunk.encode()
+
+
+def gzip_chunks(chunks, level=6):
+    """
+    Сжимаем поток на лету. После каждого пакета данные сбрасываются,
+    поэтому клиент получает первые байты сразу, а не в конце выгрузки
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
@@ -0,0 +1,123 @@
+import re
+
+from django.db.models import BooleanField, Count, ExpressionWrapper, Q, Sum
+
+from shops.models import Facet, ProductParameter
+
+# фильтр по параметру в строке запроса: param[Цвет]=красный,
+# в ключе param[Встроенная память (Гб)]>=256 знак сравнения попадает в имя
+PARAM_FILTER = re.compile(r'^param\[(?P<name>.+)\](?P<operator>[<>])?$')
+NUMBER = re.compile(r'^-?\d+([.,]\d+)?$')
+# диапазоны числовых параметров: 6..7, 256.., ..7, >=256, <7
+RANGE = re.compile(r'^(?P<low>-?\d+(?:[.,]\d+)?)?\.\.(?P<high>-?\d+(?:[.,]\d+)?)?$')
+COMPARISON = re.compile(r'^(?P<operator>[<>]=?)(?P<number>-?\d+(?:[.,]\d+)?)$')
+LOOKUPS = {'>': 'gt', '>=': 'gte', '<': 'lt', '<=': 'lte'}
+
+
+def parse_number(value):
+    """
+    Числовое значение параметра или None, если значение не число
+    """
+    value = str(value).strip()
+    if NUMBER.match(value):
+        return float(value.replace(',', '.'))
+    return None
+
+
+def value_condition(value):
+    """
+    Условие на значение параметра: диапазон или сравнение - по числовой колонке,
+    иначе - точное совпадение текста
+    """
+    match = RANGE.match(value)
+    if match and (match.group('low') or match.group('high')):
+        condition = Q(value_number__isnull=False)
+        if match.group('low'):
+            condition &= Q(value_number__gte=parse_number(match.group('low')))
+        if match.group('high'):
+            condition &= Q(value_number__lte=parse_number(match.group('high')))
+        return condition
+
+    match = COMPARISON.match(value)
+    if match:
+        return Q(**{f'value_number__{LOOKUPS[match.group("operator")]}': parse_number(match.group('number'))})
+    return Q(value=value)
+
+
+def parse_param_filters(query_params):
+    """
+    Достаем из строки запроса фильтры по параметрам: {имя параметра: [значения]}.
+    Значение может быть диапазоном: param[Диагональ (дюйм)]=6..7, param[Встроенная память (Гб)]=>=256.
+    Несколько значений одного параметра объединяются через ИЛИ, разные параметры - через И
+    """
+    filters = {}
+    for key in query_params:
+        match = PARAM_FILTER.match(key)
+        if match:
+            operator = f'{match.group("operator")}=' if match.group('operator') else ''
+            values = [operator + value for value in query_params.getlist(key) if value]
+            if values:
+                filters.setdefault(match.group('name'), []).extend(values)
+    return filters
+
+
+def filter_by_params(queryset, filters):
+    """
+    Оставляем предложения, у которых есть все выбранные значения параметров.
+    Каждое условие - подзапрос по индексу (параметр, значение) -> предложение,
+    диапазоны ищутся по индексу (параметр, числовое значение)
+    """
+    for name, values in filters.items():
+        condition = Q(pk__in=[])
+        for value in values:
+            condition |= value_condition(value)
+        queryset = queryset.filter(pk__in=ProductParameter.objects.filter(
+            condition, parameter__name=name).values('product_info_id'))
+    return queryset
+
+
+def group_facets(rows):
+    """
+    Собираем строки (параметр, значение, количество) в словарь {параметр: {значение: количество}}
+    """
+    facets = {}
+    for row in rows:
+        facets.setdefault(row['parameter__name'], {})[row['value']] = row['count']
+    return facets
+
+
+def count_facets(queryset, shop_id=None, category_id=None, in_stock=False, narrowed=False):
+    """
+    Количество предложений для каждого значения параметра в текущей выборке.
+    Если выборка задана только магазином, категорией и наличием, счетчики берутся из
+    предрассчитанной таблицы фасетов, иначе группируются только строки
+    параметров отобранных предложений
+    """
+    if not narrowed:
+        facets = Facet.objects.all()
+        if shop_id:
+            facets = facets.filter(shop_id=shop_id)
+        if category_id:
+            facets = facets.filter(category_id=category_id)
+        if in_stock:
+            facets = facets.filter(in_stock=True)
+        return group_facets(facets.values('parameter__name', 'value').annotate(
+            count=Sum('count')).order_by('parameter__name', 'value'))
+
+    parameters = ProductParameter.objects.filter(product_info_id__in=queryset.order_by().values('pk'))
+    return group_facets(parameters.values('parameter__name', 'value').annotate(
+        count=Count('id')).order_by('parameter__name', 'value'))
+
+
+def refresh_facets(shop_id):
+    """
+    Пересчитываем таблицу фасетов магазина после импорта прайса
+    """
+    counts = ProductParameter.objects.filter(product_info__shop_id=shop_id, product_info__is_active=True).annotate(
+        in_stock=ExpressionWrapper(Q(product_info__quantity__gt=0), output_field=BooleanField())).values(
+        'product_info__product__category_id', 'parameter_id', 'value', 'in_stock').annotate(
+        count=Count('id')).order_by()
+    Facet.objects.filter(shop_id=shop_id).delete()
+    Facet.objects.bulk_create([Facet(shop_id=shop_id, category_id=row['product_info__product__category_id'],
+                                     parameter_id=row['parameter_id'], value=row['value'], in_stock=row['in_stock'],
+                                     count=row['count']) for row in counts], batch_size=1000)
@@ -0,0 +1,426 @@
+from csv import DictReader
+from email.utils import formatdate
+from hashlib import sha256
+from io import BufferedReader, RawIOBase, TextIOWrapper
+from mimetypes import guess_type
+from mmap import mmap, ACCESS_READ
+from os.path import splitext
+from pathlib import Path
+from tempfile import SpooledTemporaryFile
+from urllib.parse import urlparse
+from urllib.request import url2pathname
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.files.move import file_move_safe
+from requests import get
+from yaml import (AliasEvent, ScalarEvent, SequenceStartEvent, SequenceEndEvent, MappingStartEvent,
+                  MappingEndEvent, StreamStartEvent, DocumentStartEvent, ScalarNode, SequenceNode, MappingNode)
+
+try:
+    from yaml import CSafeLoader as FeedLoader
+except ImportError:
+    from yaml import SafeLoader as FeedLoader
+
+try:
+    from ujson import loads as load_json
+except ImportError:
+    from json import loads as load_json
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+DOWNLOAD_CHUNK_SIZE = getattr(settings, 'IMPORT_DOWNLOAD_CHUNK_SIZE', 64 * 1024)
+SPOOL_MAX_SIZE = getattr(settings, 'IMPORT_SPOOL_MAX_SIZE', 8 * 1024 * 1024)
+UPLOAD_DIR = Path(getattr(settings, 'IMPORT_UPLOAD_DIR', settings.BASE_DIR / 'uploads'))
+LOCAL_ROOTS = [Path(root) for root in getattr(settings, 'IMPORT_LOCAL_ROOTS', [])] + [UPLOAD_DIR]
+
+
+class FeedDownload:
+    """
+    Скачанный прайс вместе с валидаторами для условной загрузки.
+    Если сервер ответил 304, stream пустой
+    """
+    def __init__(self, stream=None, etag='', last_modified='', digest='', content_type=''):
+        self.stream = stream
+        self.etag = etag
+        self.last_modified = last_modified
+        self.digest = digest
+        self.content_type = content_type
+
+    @property
+    def not_modified(self):
+        return self.stream is None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        if self.stream is not None:
+            self.stream.close()
+
+
+def download(url, etag='', last_modified='', chunk_size=DOWNLOAD_CHUNK_SIZE):
+    """
+    Скачиваем прайс частями во временный файл.
+    Небольшие файлы остаются в памяти, крупные сбрасываются на диск.
+    Валидаторы прошлой загрузки отправляются в If-None-Match/If-Modified-Since,
+    а по ходу загрузки считается sha256 содержимого
+    """
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+
+    with get(url, stream=True, headers=headers) as response:
+        if response.status_code == 304:
+            return FeedDownload(etag=etag, last_modified=last_modified)
+        response.raise_for_status()
+        spool = SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+        digest = sha256()
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            digest.update(chunk)
+            spool.write(chunk)
+    spool.seek(0)
+    return FeedDownload(spool, response.headers.get('ETag', ''), response.headers.get('Last-Modified', ''),
+                        digest.hexdigest(), response.headers.get('Content-Type', ''))
+
+
+class MappedFile(RawIOBase):
+    """
+    Чтение локального файла через mmap: данные берутся из страничного кэша ОС
+    без копирования всего файла в память процесса
+    """
+    def __init__(self, path):
+        super().__init__()
+        self.file = open(path, 'rb')
+        try:
+            self.map = mmap(self.file.fileno(), 0, access=ACCESS_READ)
+        except ValueError:
+            self.file.close()
+            raise ValueError(f'Пустой файл прайса: {path}')
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.map.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def seek(self, offset, whence=0):
+        self.map.seek(offset, whence)
+        return self.map.tell()
+
+    def tell(self):
+        return self.map.tell()
+
+    def close(self):
+        if not self.closed:
+            self.map.close()
+            self.file.close()
+        super().close()
+
+
+def is_local(url):
+    return urlparse(str(url)).scheme in ('', 'file')
+
+
+def local_path(url):
+    """
+    Путь к локальному прайсу по пути или ссылке file://
+    """
+    url = str(url)
+    parsed = urlparse(url)
+    return Path(url2pathname(parsed.path) if parsed.scheme == 'file' else url).resolve()
+
+
+def is_upload(url):
+    """
+    Прайс загружен поставщиком файлом и лежит во временном каталоге загрузок
+    """
+    return is_local(url) and local_path(url).is_relative_to(UPLOAD_DIR.resolve())
+
+
+def open_local(url, etag=''):
+    """
+    Открываем локальный прайс. Читать можно только файлы из IMPORT_LOCAL_ROOTS
+    и каталога загрузок. ETag строится по времени изменения и размеру файла
+    """
+    path = local_path(url)
+    if not any(path.is_relative_to(root.resolve()) for root in LOCAL_ROOTS):
+        raise ValueError(f'Импорт из {path} запрещен')
+    stat = path.stat()
+    file_etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    last_modified = formatdate(stat.st_mtime, usegmt=True)
+    if etag == file_etag:
+        return FeedDownload(etag=etag, last_modified=last_modified)
+
+    raw = MappedFile(path)
+    digest = sha256(raw.map).hexdigest()
+    return FeedDownload(BufferedReader(raw), file_etag, last_modified, digest, guess_type(path.name)[0] or '')
+
+
+def fetch(url, etag='', last_modified=''):
+    """
+    Получаем прайс по ссылке http(s), ссылке file:// или локальному пути
+    """
+    if is_local(url):
+        return open_local(url, etag=etag)
+    return download(url, etag=etag, last_modified=last_modified)
+
+
+def save_upload(upload):
+    """
+    Переносим загруженный файл прайса в каталог загрузок и возвращаем ссылку file://
+    """
+    UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+    path = UPLOAD_DIR / f'{uuid4().hex}{splitext(upload.name)[1].lower()}'
+    if hasattr(upload, 'temporary_file_path'):
+        file_move_safe(upload.temporary_file_path(), path)
+    else:
+        with open(path, 'wb') as destination:
+            for chunk in upload.chunks():
+                destination.write(chunk)
+    return path.as_uri()
+
+
+FEED_FORMATS = {}
+FEED_CONTENT_TYPES = {}
+FEED_EXTENSIONS = {}
+
+
+def register_format(name, content_types=(), extensions=()):
+    """
+    Регистрируем класс чтения прайса для формата.
+    Класс принимает бинарный поток и предоставляет shop, categories и итератор goods
+    """
+    def decorator(feed_class):
+        FEED_FORMATS[name] = feed_class
+        for content_type in content_types:
+            FEED_CONTENT_TYPES[content_type] = name
+        for extension in extensions:
+            FEED_EXTENSIONS[extension] = name
+        return feed_class
+    return decorator
+
+
+def get_format(content_type='', filename=''):
+    """
+    Определяем формат прайса по content type, затем по расширению файла.
+    По умолчанию прайс считается yaml
+    """
+    content_type = content_type.split(';')[0].strip().lower()
+    if content_type in FEED_CONTENT_TYPES:
+        return FEED_CONTENT_TYPES[content_type]
+    extension = splitext(filename)[1].lower()
+    return FEED_EXTENSIONS.get(extension, 'yaml')
+
+
+def open_feed(stream, content_type='', filename='', feed_format=None):
+    """
+    Открываем прайс подходящим классом чтения
+    """
+    feed_format = feed_format or get_format(content_type, filename)
+    if feed_format not in FEED_FORMATS:
+        raise ValueError(f'Неизвестный формат прайса: {feed_format}')
+    return FEED_FORMATS[feed_format](stream)
+
+
+@register_format('yaml', ('application/x-yaml', 'application/yaml', 'text/yaml', 'text/x-yaml'),
+                 ('.yaml', '.yml'))
+class YamlFeed:
+    """
+    Потоковое чтение прайса в формате yaml.
+    Шапка (shop, categories) читается сразу, а товары из goods
+    разбираются по одному по мере обхода, поэтому в памяти
+    никогда не находится весь прайс целиком
+    """
+    def __init__(self, stream):
+        self.loader = FeedLoader(stream)
+        self.shop = None
+        self.categories = None
+        self._goods = None
+        self._anchors = {}
+        self._read_header()
+
+    def _read_header(self):
+        self._expect(StreamStartEvent)
+        self._expect(DocumentStartEvent)
+        self._expect(MappingStartEvent)
+        while not self.loader.check_event(MappingEndEvent):
+            key = self._construct(self.loader.get_event())
+            if key == 'goods':
+                if self.shop is not None and self.categories is not None:
+                    self._expect(SequenceStartEvent)
+                    return
+                # goods идут раньше шапки - потоково их прочитать нельзя
+                self._goods = self._construct(self.loader.get_event()) or []
+            else:
+                value = self._construct(self.loader.get_event())
+                if key == 'shop':
+                    self.shop = value
+                elif key == 'categories':
+                    self.categories = value or []
+        if self.categories is None:
+            self.categories = []
+        if self._goods is None:
+            self._goods = []
+
+    @property
+    def goods(self):
+        """
+        Итератор по товарам прайса
+        """
+        if self._goods is not None:
+            yield from self._goods
+            return
+        while not self.loader.check_event(SequenceEndEvent):
+            yield self._construct(self.loader.get_event())
+        self.loader.dispose()
+
+    def _expect(self, event_class):
+        event = self.loader.get_event()
+        if not isinstance(event, event_class):
+            raise ValueError(f'Неверный формат прайса: {event}')
+        return event
+
+    def _construct(self, event):
+        return self.loader.construct_document(self._compose(event, self._anchors))
+
+    def _compose(self, event, anchors):
+        """
+        Собираем узел yaml из потока событий
+        """
+        loader = self.loader
+        if isinstance(event, AliasEvent):
+            return anchors[event.anchor]
+        if isinstance(event, ScalarEvent):
+            tag = event.tag
+            if tag is None or tag == '!':
+                tag = loader.resolve(ScalarNode, event.value, event.implicit)
+            node = ScalarNode(tag, event.value, event.start_mark, event.end_mark, style=event.style)
+        elif isinstance(event, SequenceStartEvent):
+            tag = event.tag
+            if tag is None or tag == '!':
+                tag = loader.resolve(SequenceNode, None, event.implicit)
+            node = SequenceNode(tag, [], event.start_mark, None, flow_style=event.flow_style)
+            while not loader.check_event(SequenceEndEvent):
+                node.value.append(self._compose(loader.get_event(), anchors))
+            node.end_mark = loader.get_event().end_mark
+        elif isinstance(event, MappingStartEvent):
+            tag = event.tag
+            if tag is None or tag == '!':
+                tag = loader.resolve(MappingNode, None, event.implicit)
+            node = MappingNode(tag, [], event.start_mark, None, flow_style=event.flow_style)
+            while not loader.check_event(MappingEndEvent):
+                key = self._compose(loader.get_event(), anchors)
+                value = self._compose(loader.get_event(), anchors)
+                node.value.append((key, value))
+            node.end_mark = loader.get_event().end_mark
+        else:
+            raise ValueError(f'Неверный формат прайса: {event}')
+        if event.anchor is not None:
+            anchors[event.anchor] = node
+        return node
+
+
+class RecordFeed:
+    """
+    Прайс в виде потока записей: первая запись - шапка с shop и categories,
+    остальные - товары. Если в шапке есть goods, прайс записан одним документом
+    """
+    def __init__(self, stream):
+        self.records = self.read_records(stream)
+        header = next(self.records, None)
+        if not isinstance(header, dict) or 'shop' not in header:
+            raise ValueError('Неверный формат прайса: первая запись должна содержать shop')
+        self.shop = header['shop']
+        self.categories = header.get('categories') or []
+        self._goods = header.get('goods')
+
+    def read_records(self, stream):
+        raise NotImplementedError
+
+    @property
+    def goods(self):
+        """
+        Итератор по товарам прайса
+        """
+        if self._goods is not None:
+            yield from self._goods
+        yield from self.records
+
+
+@register_format('jsonl', ('application/x-ndjson', 'application/jsonl', 'application/x-jsonlines'),
+                 ('.jsonl', '.ndjson'))
+class JsonLinesFeed(RecordFeed):
+    """
+    Прайс в формате JSON Lines, одна запись на строку
+    """
+    def read_records(self, stream):
+        for line in stream:
+            if line.strip():
+                yield load_json(line)
+
+
+@register_format('msgpack', ('application/msgpack', 'application/x-msgpack'), ('.msgpack', '.mpk'))
+class MsgpackFeed(RecordFeed):
+    """
+    Прайс в формате msgpack - последовательность записей подряд
+    """
+    def read_records(self, stream):
+        if msgpack is None:
+            raise ValueError('Для импорта прайса в формате msgpack установите пакет msgpack')
+        yield from msgpack.Unpacker(stream, raw=False)
+
+
+@register_format('csv', ('text/csv', 'application/csv'), ('.csv',))
+class CsvFeed:
+    """
+    Прайс в формате csv, одна строка на товар.
+    Колонки: shop, category, category_name, id, model, name, price, price_rrc, quantity,
+    параметры товара - колонки с префиксом PARAMETER_PREFIX, например "param:Цвет".
+    Файл читается дважды: сначала собираются магазин и категории, затем товары
+    """
+    PARAMETER_PREFIX = 'param:'
+
+    def __init__(self, stream):
+        self.stream = TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+        self.shop = None
+        categories = {}
+        for row in DictReader(self.stream):
+            self.shop = self.shop or row.get('shop')
+            # название категории берется из первой строки, где оно указано
+            category_id = int(row['category'])
+            if not categories.get(category_id):
+                categories[category_id] = row.get('category_name') or ''
+        if not self.shop:
+            raise ValueError('Неверный формат прайса: не указан магазин')
+        self.categories = [{'id': category_id, 'name': name} for category_id, name in categories.items()]
+
+    @property
+    def goods(self):
+        """
+        Итератор по товарам прайса
+        """
+        self.stream.seek(0)
+        prefix = self.PARAMETER_PREFIX
+        for row in DictReader(self.stream):
+            yield {
+                'id': row.get('id') or None,
+                'category': row['category'],
+                'model': row['model'],
+                'name': row['name'],
+                'price': row['price'],
+                'price_rrc': row['price_rrc'],
+                'quantity': row['quantity'],
+                'parameters': {column[len(prefix):]: value for column, value in row.items()
+                               if column and column.startswith(prefix) and value != ''},
+            }
@@ -0,0 +1,139 @@
+import csv
+import json
+from random import Random
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Схема синтетического прайса: категории с брендами, линейками и параметрами.
+# Набор значений каждого параметра ограничен, как в настоящих прайсах,
+# поэтому на миллион товаров приходится несколько десятков параметров
+CATEGORIES = [
+    {
+        'id': 224, 'name': 'Смартфоны', 'price': (5000, 150000),
+        'brands': {'Apple': ['iPhone XR', 'iPhone XS', 'iPhone 11'], 'Samsung': ['Galaxy S10', 'Galaxy A50'],
+                   'Xiaomi': ['Redmi Note 8', 'Mi 9'], 'Huawei': ['P30', 'Mate 20']},
+        'parameters': {
+            'Диагональ (дюйм)': [5.0, 5.5, 5.8, 6.1, 6.3, 6.4, 6.5, 6.7],
+            'Разрешение (пикс)': ['1280x720', '1920x1080', '2340x1080', '1792x828', '2688x1242'],
+            'Встроенная память (Гб)': [16, 32, 64, 128, 256, 512],
+            'Цвет': ['черный', 'белый', 'красный', 'синий', 'золотистый', 'серебристый', 'зеленый'],
+        },
+    },
+    {
+        'id': 15, 'name': 'Аксессуары', 'price': (200, 5000),
+        'brands': {'Anker': ['PowerLine', 'PowerCore'], 'Baseus': ['Cafule', 'Encok'], 'Belkin': ['Boost']},
+        'parameters': {
+            'Тип': ['кабель', 'чехол', 'зарядное устройство', 'наушники', 'внешний аккумулятор'],
+            'Длина кабеля (м)': [0.5, 1, 1.2, 2, 3],
+            'Цвет': ['черный', 'белый', 'красный', 'синий'],
+        },
+    },
+    {
+        'id': 1, 'name': 'Flash-накопители', 'price': (300, 4000),
+        'brands': {'Kingston': ['DataTraveler'], 'SanDisk': ['Ultra', 'Cruzer'], 'Transcend': ['JetFlash']},
+        'parameters': {
+            'Объем (Гб)': [8, 16, 32, 64, 128, 256],
+            'Интерфейс': ['USB 2.0', 'USB 3.0', 'USB 3.1', 'USB Type-C'],
+            'Цвет': ['черный', 'серебристый', 'синий'],
+        },
+    },
+]
+
+FORMATS = ('yaml', 'jsonl', 'csv', 'msgpack')
+EXTENSIONS = {'yaml': '.yaml', 'jsonl': '.jsonl', 'csv': '.csv', 'msgpack': '.msgpack'}
+
+
+def generate_goods(count, seed=0, start_id=1):
+    """
+    Генерируем товары синтетического прайса в той же схеме, что и data/shop1.yaml
+    """
+    random = Random(seed)
+    for index in range(count):
+        category = random.choice(CATEGORIES)
+        brand = random.choice(list(category['brands']))
+        line = random.choice(category['brands'][brand])
+        parameters = {name: random.choice(values) for name, values in category['parameters'].items()
+                      if random.random() < 0.9}
+        price = random.randint(*category['price'])
+        yield {
+            'id': start_id + index,
+            'category': category['id'],
+            'model': f'{brand.lower()}/{line.lower().replace(" ", "-")}',
+            'name': f'{brand} {line} #{start_id + index}',
+            'price': price,
+            'price_rrc': price + price // 10,
+            'quantity': random.randint(0, 100),
+            'parameters': parameters,
+        }
+
+
+def feed_header(shop):
+    return {'shop': shop, 'categories': [{'id': category['id'], 'name': category['name']}
+                                         for category in CATEGORIES]}
+
+
+def _yaml_value(value):
+    # строка в формате JSON - корректный yaml-скаляр в двойных кавычках
+    return json.dumps(value, ensure_ascii=False) if isinstance(value, str) else value
+
+
+def write_yaml(output, shop, goods):
+    output.write(f'shop: {_yaml_value(shop)}\ncategories:\n')
+    for category in feed_header(shop)['categories']:
+        output.write(f'  - id: {category["id"]}\n    name: {_yaml_value(category["name"])}\n')
+    output.write('goods:\n')
+    for item in goods:
+        output.write(f'  - id: {item["id"]}\n    category: {item["category"]}\n'
+                     f'    model: {_yaml_value(item["model"])}\n    name: {_yaml_value(item["name"])}\n'
+                     f'    price: {item["price"]}\n    price_rrc: {item["price_rrc"]}\n'
+                     f'    quantity: {item["quantity"]}\n    parameters:{"" if item["parameters"] else " {}"}\n')
+        for name, value in item['parameters'].items():
+            output.write(f'      {_yaml_value(name)}: {_yaml_value(value)}\n')
+
+
+def write_jsonl(output, shop, goods):
+    output.write(json.dumps(feed_header(shop), ensure_ascii=False) + '\n')
+    for item in goods:
+        output.write(json.dumps(item, ensure_ascii=False) + '\n')
+
+
+def write_csv(output, shop, goods):
+    names = {category['id']: category['name'] for category in CATEGORIES}
+    parameters = sorted({name for category in CATEGORIES for name in category['parameters']})
+    writer = csv.writer(output)
+    writer.writerow(['shop', 'category', 'category_name', 'id', 'model', 'name', 'price', 'price_rrc', 'quantity'] +
+                    [f'param:{name}' for name in parameters])
+    for item in goods:
+        writer.writerow([shop, item['category'], names[item['category']], item['id'], item['model'], item['name'],
+                         item['price'], item['price_rrc'], item['quantity']] +
+                        [item['parameters'].get(name, '') for name in parameters])
+
+
+def write_msgpack(output, shop, goods):
+    if msgpack is None:
+        raise ValueError('Для генерации прайса в формате msgpack установите пакет msgpack')
+    packer = msgpack.Packer()
+    output.write(packer.pack(feed_header(shop)))
+    for item in goods:
+        output.write(packer.pack(item))
+
+
+def write_feed(path, count, shop='Синтетический магазин', feed_format='yaml', seed=0):
+    """
+    Записываем синтетический прайс на count товаров в файл
+    """
+    goods = generate_goods(count, seed=seed)
+    if feed_format == 'msgpack':
+        with open(path, 'wb') as output:
+            write_msgpack(output, shop, goods)
+        return path
+
+    writers = {'yaml': write_yaml, 'jsonl': write_jsonl, 'csv': write_csv}
+    if feed_format not in writers:
+        raise ValueError(f'Неизвестный формат прайса: {feed_format}')
+    with open(path, 'w', encoding='utf-8', newline='') as output:
+        writers[feed_format](output, shop, goods)
+    return path
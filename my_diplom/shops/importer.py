@@ -0,0 +1,311 @@
+from contextlib import nullcontext
+from decimal import Decimal
+from time import perf_counter
+from urllib.parse import urlparse
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from orders.models import Order
+from shops.cache import bump_generation
+from shops.catalog import refresh_catalog, refresh_category_names
+from shops.facets import parse_number, refresh_facets
+from shops.feeds import fetch, is_local, is_upload, local_path, open_feed
+from shops.lookups import LookupCache
+from shops.models import CatalogEntry, Category, Shop, ProductInfo, Product, Parameter, ProductParameter
+
+IMPORT_BATCH_SIZE = getattr(settings, 'IMPORT_BATCH_SIZE', 1000)
+
+# поля предложения, по которым определяется, изменилось ли оно
+OFFER_FIELDS = ('product_id', 'name', 'price', 'price_rrc', 'quantity')
+
+
+def batched(iterable, size):
+    """
+    Разбиваем итерируемый объект на списки длиной не больше size
+    """
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class PriceListImporter:
+    """
+    Класс для пакетного импорта прайса поставщика.
+    Продукты и параметры берутся из кэша, прогретого в начале импорта,
+    а записи пишутся через bulk_create, поэтому число запросов зависит
+    от количества пакетов, а не от количества товаров.
+    Повторный импорт сопоставляет товары по внешнему id и меняет
+    только то, что изменилось в прайсе.
+    """
+    def __init__(self, batch_size=IMPORT_BATCH_SIZE, progress=None):
+        self.batch_size = batch_size
+        self.progress = progress
+        self.products = LookupCache(Product, ('name', 'category_id'))
+        self.parameters = LookupCache(Parameter, ('name',))
+        self.vanished = set()
+        self.renamed = []
+        self.stats = {'goods': 0, 'created': 0, 'updated': 0, 'unchanged': 0, 'deleted': 0,
+                      'parameters': 0, 'batches': 0, 'seconds': 0.0, 'rows_per_sec': 0.0, 'skipped': ''}
+
+    def run(self, shop_name, categories, goods, source=None):
+        """
+        Импортируем прайс в одной транзакции и возвращаем статистику.
+        goods может быть любым итератором - товары читаются пакетами.
+        source - ссылка и валидаторы прайса, которые сохраняются в магазине
+        """
+        self.started = perf_counter()
+        # общие для всех магазинов категории меняются до импорта короткой транзакцией,
+        # чтобы параллельные импорты не держали блокировки их строк до конца
+        self.save_categories(categories)
+        with transaction.atomic():
+            shop, _ = Shop.objects.get_or_create(name=shop_name)
+            # блокируем магазин, чтобы два импорта одного прайса не шли параллельно
+            shop = Shop.objects.select_for_update().get(id=shop.id)
+            self.link_categories(shop, categories)
+            self.products.warm(category_id__in=[category['id'] for category in categories])
+            self.parameters.warm()
+            self.vanished = set(ProductInfo.objects.filter(shop_id=shop.id, is_active=True).values_list(
+                'id', flat=True))
+            for batch in batched(goods, self.batch_size):
+                self.save_goods(shop, batch)
+                self.stats['batches'] += 1
+                self.update_speed()
+                if self.progress:
+                    self.progress(self.stats)
+            # итоги корзин с товарами магазина пересчитываются по новым ценам,
+            # итоги оформленных заказов остаются такими, какими были при оформлении
+            baskets = self.touched_baskets(shop)
+            self.deactivate_vanished()
+            Order.objects.filter(id__in=baskets).refresh_totals()
+            refresh_facets(shop.id)
+            if source:
+                Shop.objects.filter(id=shop.id).update(**source)
+            # закэшированные ответы сбрасываем только после фиксации транзакции
+            scopes = ['shops', 'categories']
+            # переименованные категории видны в записях каталога
+            if self.stats['created'] or self.stats['updated'] or self.stats['deleted'] or self.renamed:
+                scopes.append('products')
+            transaction.on_commit(lambda: bump_generation(*scopes))
+
+        self.stats['cache'] = {'products': self.products.stats, 'parameters': self.parameters.stats}
+        self.update_speed()
+        return self.stats
+
+    def update_speed(self):
+        """
+        Пересчитываем время импорта и скорость в строках в секунду
+        """
+        seconds = perf_counter() - self.started
+        self.stats['seconds'] = round(seconds, 3)
+        if seconds:
+            self.stats['rows_per_sec'] = round(self.stats['goods'] / seconds, 1)
+
+    def save_categories(self, categories):
+        """
+        Создаем новые категории и переименовываем только те, чье название изменилось.
+        Если прайс не указал название, существующая категория не меняется,
+        а новая без названия не создается.
+        Строки меняются в порядке id, поэтому параллельные импорты с общими
+        категориями не блокируют друг друга взаимно
+        """
+        names = dict(sorted((int(category['id']), category['name']) for category in categories))
+        if not names:
+            return
+        named = {category_id: name for category_id, name in names.items() if name}
+        with transaction.atomic():
+            Category.objects.bulk_create([Category(id=category_id, name=name) for category_id, name in named.items()],
+                                         ignore_conflicts=True)
+            current = dict(Category.objects.filter(id__in=names).values_list('id', 'name'))
+            unknown = sorted(set(names) - set(current))
+            if unknown:
+                raise ValueError(f'Неверный формат прайса: не указаны названия категорий {unknown}')
+            self.renamed = [Category(id=category_id, name=name) for category_id, name in named.items()
+                            if current[category_id] != name]
+            if self.renamed:
+                Category.objects.bulk_update(self.renamed, ['name'])
+                refresh_category_names([{'id': category.id, 'name': category.name} for category in self.renamed])
+
+    def link_categories(self, shop, categories):
+        """
+        Привязываем категории к магазину
+        """
+        through = Category.shops.through
+        through.objects.bulk_create([through(category_id=category_id, shop_id=shop.id) for category_id in
+                                     sorted({int(category['id']) for category in categories})], ignore_conflicts=True)
+
+    def save_goods(self, shop, goods):
+        """
+        Сохраняем пакет товаров как разницу с уже загруженными:
+        новые предложения создаем, измененные обновляем, неизмененные не трогаем
+        """
+        products = self.products.get_many([(item['name'], int(item['category'])) for item in goods])
+        parameters = self.parameters.get_many([name for item in goods for name in (item.get('parameters') or {})])
+
+        offers = []
+        for item in goods:
+            external_id = item.get('id')
+            offers.append({
+                'external_id': int(external_id) if external_id is not None else None,
+                'product_id': products[(item['name'], int(item['category']))],
+                'name': item['model'],
+                'price': Decimal(str(item['price'])),
+                'price_rrc': Decimal(str(item['price_rrc'])),
+                'quantity': int(item['quantity']),
+                'parameters': {parameters[name]: str(value) for name, value in (item.get('parameters') or {}).items()},
+            })
+
+        # старые записи ищем по внешнему id, а записи без него - по продукту
+        existing = ProductInfo.objects.filter(shop_id=shop.id).filter(
+            Q(external_id__in={offer['external_id'] for offer in offers if offer['external_id'] is not None}) |
+            Q(product_id__in={offer['product_id'] for offer in offers})).values(
+            'id', 'external_id', 'is_active', *OFFER_FIELDS)
+        by_external_id = {row['external_id']: row for row in existing if row['external_id'] is not None}
+        by_product_id = {row['product_id']: row for row in existing}
+
+        claimed = set()
+        for offer in offers:
+            row = by_external_id.get(offer['external_id']) or by_product_id.get(offer['product_id'])
+            if row and row['id'] not in claimed:
+                claimed.add(row['id'])
+                offer['row'] = row
+        self.vanished -= claimed
+
+        current_parameters = {}
+        for parameter in ProductParameter.objects.filter(product_info_id__in=claimed).values(
+                'id', 'product_info_id', 'parameter_id', 'value'):
+            current_parameters.setdefault(parameter['product_info_id'], {})[parameter['parameter_id']] = parameter
+
+        new_offers, changed_offers, refreshed = [], [], []
+        new_parameters, changed_parameters, removed_parameters = [], [], []
+        for offer in offers:
+            row = offer.get('row')
+            if row is None:
+                new_offers.append(offer)
+                continue
+
+            parameters = current_parameters.get(row['id'], {})
+            # пропавшее раньше предложение снова появилось в прайсе
+            offer_changed = (row['external_id'] != offer['external_id'] or not row['is_active'] or
+                             any(row[field] != offer[field] for field in OFFER_FIELDS))
+            parameters_changed = False
+            for parameter_id, value in offer['parameters'].items():
+                parameter = parameters.get(parameter_id)
+                if parameter is None:
+                    new_parameters.append(ProductParameter(product_info_id=row['id'], parameter_id=parameter_id,
+                                                           value=value, value_number=parse_number(value)))
+                    parameters_changed = True
+                elif parameter['value'] != value:
+                    changed_parameters.append(ProductParameter(id=parameter['id'], value=value,
+                                                               value_number=parse_number(value)))
+                    parameters_changed = True
+            for parameter_id, parameter in parameters.items():
+                if parameter_id not in offer['parameters']:
+                    removed_parameters.append(parameter['id'])
+                    parameters_changed = True
+
+            if offer_changed:
+                changed_offers.append(ProductInfo(id=row['id'], external_id=offer['external_id'], is_active=True,
+                                                  **{field: offer[field] for field in OFFER_FIELDS}))
+            if offer_changed or parameters_changed:
+                refreshed.append(row['id'])
+                self.stats['updated'] += 1
+            else:
+                self.stats['unchanged'] += 1
+
+        product_infos = ProductInfo.objects.bulk_create([
+            ProductInfo(shop_id=shop.id, external_id=offer['external_id'],
+                        **{field: offer[field] for field in OFFER_FIELDS}) for offer in new_offers])
+        for product_info, offer in zip(product_infos, new_offers):
+            new_parameters.extend(ProductParameter(product_info_id=product_info.id, parameter_id=parameter_id,
+                                                   value=value, value_number=parse_number(value))
+                                  for parameter_id, value in offer['parameters'].items())
+
+        ProductInfo.objects.bulk_update(changed_offers, ['external_id', 'is_active', *OFFER_FIELDS],
+                                        batch_size=self.batch_size)
+        ProductParameter.objects.bulk_create(new_parameters, batch_size=self.batch_size)
+        ProductParameter.objects.bulk_update(changed_parameters, ['value', 'value_number'],
+                                             batch_size=self.batch_size)
+        if removed_parameters:
+            ProductParameter.objects.filter(id__in=removed_parameters).delete()
+        refresh_catalog([product_info.id for product_info in product_infos] + refreshed, batch_size=self.batch_size)
+
+        self.stats['goods'] += len(goods)
+        self.stats['created'] += len(new_offers)
+        self.stats['parameters'] += len(new_parameters) + len(changed_parameters) + len(removed_parameters)
+
+    def touched_baskets(self, shop):
+        """
+        Корзины с товарами магазина, если цены или состав прайса изменились
+        """
+        if not self.stats['updated']:
+            return []
+        return list(Order.objects.filter(state='basket', order_items__product_info__shop_id=shop.id).values_list(
+            'id', flat=True).order_by().distinct())
+
+    def deactivate_vanished(self):
+        """
+        Снимаем с продажи предложения, которых больше нет в прайсе: они убираются
+        из каталога, а сами строки остаются, чтобы не терять позиции заказов
+        """
+        vanished = sorted(self.vanished)
+        for batch in batched(vanished, self.batch_size):
+            ProductInfo.objects.filter(id__in=batch).update(is_active=False)
+            CatalogEntry.objects.filter(product_info_id__in=batch).delete()
+        self.stats['deleted'] = len(vanished)
+
+
+def import_feed(stream, batch_size=IMPORT_BATCH_SIZE, progress=None, source=None, content_type='', filename=''):
+    """
+    Потоковый импорт прайса из файлового объекта.
+    Формат выбирается по content type или расширению файла
+    """
+    feed = open_feed(stream, content_type=content_type, filename=filename)
+    importer = PriceListImporter(batch_size=batch_size, progress=progress)
+    return importer.run(feed.shop, feed.categories, feed.goods, source=source)
+
+
+def skip_import(reason):
+    """
+    Статистика пропущенного импорта
+    """
+    stats = PriceListImporter().stats
+    stats['skipped'] = reason
+    return stats
+
+
+def import_url(url, batch_size=IMPORT_BATCH_SIZE, progress=None, phase=None, writers=None):
+    """
+    Скачиваем и импортируем прайс по ссылке http(s), file:// или локальному пути.
+    Импорт пропускается, если сервер ответил 304 или содержимое
+    совпало с прошлым импортом по хешу.
+    writers - семафор, ограничивающий число одновременных транзакций импорта
+    """
+    if is_local(url):
+        url = local_path(url).as_uri()
+    shop = Shop.objects.filter(url=url).first()
+    feed = fetch(url, etag=shop.feed_etag if shop else '', last_modified=shop.feed_last_modified if shop else '')
+    with feed:
+        if feed.not_modified:
+            return skip_import('not_modified')
+
+        source = {'feed_etag': feed.etag, 'feed_last_modified': feed.last_modified, 'feed_hash': feed.digest}
+        # ссылку на временный загруженный файл в магазине не сохраняем
+        if not is_upload(url):
+            source['url'] = url
+        if shop and shop.feed_hash == feed.digest:
+            Shop.objects.filter(id=shop.id).update(**source)
+            bump_generation('shops')
+            return skip_import('unchanged')
+
+        with writers or nullcontext():
+            if phase:
+                phase('importing')
+            return import_feed(feed.stream, batch_size=batch_size, progress=progress, source=source,
+                               content_type=feed.content_type, filename=urlparse(url).path)
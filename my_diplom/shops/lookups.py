@@ -0,0 +1,74 @@
+class LookupCache:
+    """
+    Кэш соответствия ключ -> id для справочников (продукты, параметры).
+    Прогревается одним запросом, недостающие ключи ищутся и создаются
+    пакетом, поэтому число запросов зависит от числа разных ключей,
+    а не от числа строк.
+    Созданные id видны только внутри текущей транзакции,
+    поэтому кэш живет столько же, сколько один импорт.
+    Ключи справочников уникальны в БД: если параллельный импорт уже создал
+    запись, вставка пропускается, а id перечитывается
+    """
+    def __init__(self, model, fields):
+        self.model = model
+        self.fields = tuple(fields)
+        self.ids = {}
+        self.complete = False
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, values):
+        return values[0] if len(self.fields) == 1 else tuple(values)
+
+    def _values(self, key):
+        return (key,) if len(self.fields) == 1 else key
+
+    def warm(self, **filters):
+        """
+        Загружаем справочник одним запросом.
+        Без фильтров кэш считается полным и промахи сразу создаются
+        """
+        for row in self.model.objects.filter(**filters).values_list('id', *self.fields):
+            self.ids.setdefault(self._key(row[1:]), row[0])
+        self.complete = not filters
+
+    def get(self, key):
+        return self.get_many([key])[key]
+
+    def get_many(self, keys):
+        """
+        Возвращаем id для списка ключей, недостающие записи создаем
+        """
+        missing = set()
+        for key in keys:
+            if key in self.ids:
+                self.hits += 1
+            else:
+                self.misses += 1
+                missing.add(key)
+        if missing:
+            if not self.complete:
+                self._fetch(missing)
+                missing -= self.ids.keys()
+            self._create(missing)
+        return {key: self.ids[key] for key in keys}
+
+    def _fetch(self, keys):
+        filters = {f'{field}__in': {self._values(key)[index] for key in keys}
+                   for index, field in enumerate(self.fields)}
+        for row in self.model.objects.filter(**filters).values_list('id', *self.fields):
+            key = self._key(row[1:])
+            if key in keys:
+                self.ids.setdefault(key, row[0])
+
+    def _create(self, keys):
+        if not keys:
+            return
+        # ключи вставляются по порядку, чтобы параллельные импорты не ждали друг друга взаимно
+        self.model.objects.bulk_create([self.model(**dict(zip(self.fields, self._values(key))))
+                                        for key in sorted(keys)], ignore_conflicts=True)
+        self._fetch(keys)
+
+    @property
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.ids)}
@@ -0,0 +1,97 @@
+import json
+import subprocess
+import tracemalloc
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from shops.feeds import UPLOAD_DIR
+from shops.generator import EXTENSIONS, FORMATS, write_feed
+from shops.importer import IMPORT_BATCH_SIZE, import_url
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def measure(path, batch_size, trace_memory):
+    """
+    Импортируем прайс тем же путем, что и воркер, и замеряем время, число запросов и память.
+    Пик памяти считается через tracemalloc отдельно для каждого замера:
+    ru_maxrss - пик за все время процесса и после большого прайса не меняется
+    """
+    if trace_memory:
+        tracemalloc.reset_peak()
+    started = perf_counter()
+    with CaptureQueriesContext(connection) as queries:
+        stats = import_url(path, batch_size=batch_size)
+    seconds = perf_counter() - started
+    result = {
+        'seconds': round(seconds, 3),
+        'queries': len(queries),
+        'rows_per_sec': round(stats['goods'] / seconds, 1) if seconds else 0.0,
+        'created': stats['created'],
+        'updated': stats['updated'],
+        'unchanged': stats['unchanged'],
+    }
+    if trace_memory:
+        result['peak_traced_kb'] = tracemalloc.get_traced_memory()[1] // 1024
+    return result
+
+
+class Command(BaseCommand):
+    help = 'Замер скорости импорта прайсов на синтетических данных'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', type=int, nargs='+', default=[1000, 10000],
+                            help='размеры прайсов в товарах')
+        parser.add_argument('--format', choices=FORMATS, default='yaml', dest='feed_format')
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+        parser.add_argument('--report', help='файл для отчета в формате JSON')
+        parser.add_argument('--trace-memory', action='store_true',
+                            help='замерять пик памяти через tracemalloc (замедляет импорт)')
+        parser.add_argument('--keep', action='store_true', help='не откатывать импортированные данные')
+
+    def handle(self, *args, **options):
+        report = {
+            'commit': git_commit(),
+            'created_at': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'format': options['feed_format'],
+            'batch_size': options['batch_size'],
+            'results': [],
+        }
+        if options['trace_memory']:
+            tracemalloc.start()
+        # прайсы кладутся в каталог загрузок: импорт из него разрешен,
+        # а ссылка на файл не сохраняется в магазине, поэтому повторный импорт не пропускается
+        UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+        with TemporaryDirectory(dir=UPLOAD_DIR) as directory, transaction.atomic():
+            for scale in options['scales']:
+                path = Path(directory) / f'bench_{scale}{EXTENSIONS[options["feed_format"]]}'
+                write_feed(path, scale, shop=f'Benchmark {scale}', feed_format=options['feed_format'])
+                # первый импорт создает все записи, повторный проверяет путь без изменений
+                for phase in ('initial', 'reimport'):
+                    result = {'goods': scale, 'phase': phase,
+                              **measure(path, options['batch_size'], options['trace_memory'])}
+                    report['results'].append(result)
+                    self.stdout.write(f'{scale:>8} {phase:<9} {result["seconds"]:>9.3f} c '
+                                      f'{result["queries"]:>7} запросов {result["rows_per_sec"]:>10.1f} строк/с')
+            if not options['keep']:
+                transaction.set_rollback(True)
+        if options['trace_memory']:
+            tracemalloc.stop()
+
+        if options['report']:
+            with open(options['report'], 'w', encoding='utf-8') as output:
+                json.dump(report, output, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Отчет записан в {options["report"]}'))
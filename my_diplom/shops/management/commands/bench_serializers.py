@@ -0,0 +1,92 @@
+import json
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from orders.models import Order, OrderItem
+from orders.serializers import OrderSerializer, serialize_orders
+from shops.generator import write_feed
+from shops.importer import import_feed
+from shops.management.commands.bench_import import git_commit
+from shops.models import ProductInfo
+from shops.serializers import ProductInfoSerializer, serialize_product_infos
+from users.models import User
+
+
+def measure(serialize, repeat):
+    """
+    Лучшее время из repeat запусков вместе с чтением из БД, число запросов
+    """
+    best = None
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as queries:
+            started = perf_counter()
+            json.dumps(serialize(), ensure_ascii=False)
+            seconds = perf_counter() - started
+        best = seconds if best is None else min(best, seconds)
+    return {'seconds': round(best, 4), 'queries': len(queries)}
+
+
+class Command(BaseCommand):
+    help = 'Замер скорости сериализации списков товаров и заказов: DRF и быстрый путь через values()'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', type=int, nargs='+', default=[1000, 10000], help='количество строк')
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--report', help='файл для отчета в формате JSON')
+
+    def handle(self, *args, **options):
+        report = {
+            'commit': git_commit(),
+            'created_at': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'results': [],
+        }
+        with TemporaryDirectory() as directory, transaction.atomic():
+            user = User.objects.create(email='bench-serializers@example.com', type='buyer')
+            for scale in options['scales']:
+                path = Path(directory) / f'bench_{scale}.yaml'
+                write_feed(path, scale, shop=f'Benchmark {scale}')
+                with open(path, 'rb') as stream:
+                    import_feed(stream, filename=str(path))
+                product_infos = ProductInfo.objects.filter(shop__name=f'Benchmark {scale}')
+                order = Order.objects.create(user=user, state='basket')
+                OrderItem.objects.bulk_create([OrderItem(order=order, product_info_id=product_info_id, quantity=1)
+                                               for product_info_id in product_infos.values_list('id', flat=True)])
+                orders = Order.objects.filter(id=order.id)
+                orders.refresh_totals()
+
+                cases = {
+                    'products': (
+                        lambda: ProductInfoSerializer(product_infos.select_related('shop', 'product__category')
+                                                      .prefetch_related('product_parameters__parameter'),
+                                                      many=True).data,
+                        # те же предложения, что и у DRF, а не записи каталога
+                        lambda: list(serialize_product_infos(product_infos.values('id')).values()),
+                    ),
+                    'orders': (
+                        lambda: OrderSerializer(orders.prefetch_related(
+                            'order_items__product_info__product__category',
+                            'order_items__product_info__product_parameters__parameter').select_related('contact'),
+                            many=True).data,
+                        lambda: serialize_orders(orders),
+                    ),
+                }
+                for name, (drf, fast) in cases.items():
+                    result = {'rows': scale, 'listing': name,
+                              'drf': measure(drf, options['repeat']), 'fast': measure(fast, options['repeat'])}
+                    result['speedup'] = round(result['drf']['seconds'] / result['fast']['seconds'], 1)
+                    report['results'].append(result)
+                    self.stdout.write(f'{scale:>8} {name:<9} DRF {result["drf"]["seconds"]:>8.3f} c '
+                                      f'быстрый {result["fast"]["seconds"]:>8.3f} c  x{result["speedup"]}')
+            transaction.set_rollback(True)
+
+        if options['report']:
+            with open(options['report'], 'w', encoding='utf-8') as output:
+                json.dump(report, output, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Отчет записан в {options["report"]}'))
@@ -0,0 +1,34 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from shops.export import EXPORT_CHUNK_SIZE, EXPORT_FORMATS, export_chunks, export_queryset, gzip_chunks
+
+
+class Command(BaseCommand):
+    help = 'Потоковая выгрузка каталога в JSON Lines или CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', nargs='?', default='-', help='файл выгрузки, по умолчанию stdout')
+        parser.add_argument('--format', choices=EXPORT_FORMATS, default='jsonl', dest='feed_format')
+        parser.add_argument('--shop', type=int, help='id магазина')
+        parser.add_argument('--category', type=int, help='id категории')
+        parser.add_argument('--gzip', action='store_true', help='сжимать выгрузку')
+        parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        queryset = export_queryset(shop_id=options['shop'], category_id=options['category'])
+        chunks = export_chunks(options['feed_format'], queryset, chunk_size=options['chunk_size'])
+        if options['gzip']:
+            chunks = gzip_chunks(chunks)
+
+        if options['output'] == '-':
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
+            return
+
+        with open(options['output'], 'wb') as output:
+            for chunk in chunks:
+                output.write(chunk)
+        self.stderr.write(self.style.SUCCESS(f'Каталог выгружен в {options["output"]}'))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from shops.generator import FORMATS, write_feed
+
+
+class Command(BaseCommand):
+    help = 'Генерация синтетического прайса для тестов и замеров импорта'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='путь к файлу прайса')
+        parser.add_argument('--goods', type=int, default=1000, help='количество товаров')
+        parser.add_argument('--format', choices=FORMATS, default='yaml', dest='feed_format')
+        parser.add_argument('--shop', default='Синтетический магазин', help='название магазина')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        write_feed(options['output'], options['goods'], shop=options['shop'],
+                   feed_format=options['feed_format'], seed=options['seed'])
+        self.stdout.write(self.style.SUCCESS(f'Прайс на {options["goods"]} товаров записан в {options["output"]}'))
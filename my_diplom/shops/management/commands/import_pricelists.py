@@ -0,0 +1,107 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from shops.importer import IMPORT_BATCH_SIZE, import_url
+from shops.models import Shop
+
+# семафор писателей в БД, общий для всех воркеров пула
+writers = None
+
+
+def init_worker(semaphore):
+    """
+    Инициализация воркера: соединения с БД, унаследованные
+    от родительского процесса, использовать нельзя
+    """
+    global writers
+    writers = semaphore
+    connections.close_all()
+
+
+def import_shop(shop_id, name, url, batch_size):
+    """
+    Импорт прайса одного магазина. Ошибка одного магазина
+    не прерывает импорт остальных
+    """
+    started = perf_counter()
+    try:
+        stats = import_url(url, batch_size=batch_size, writers=writers)
+    except Exception as error:
+        stats = {'error': str(error)}
+    finally:
+        connections.close_all()
+    stats.update({'shop_id': shop_id, 'name': name, 'seconds': round(perf_counter() - started, 3)})
+    return stats
+
+
+class Command(BaseCommand):
+    help = 'Импорт прайсов всех магазинов по их ссылкам или из указанных файлов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('sources', nargs='*',
+                            help='пути или ссылки на прайсы, по умолчанию - ссылки всех магазинов')
+        parser.add_argument('--shop', type=int, action='append', dest='shops',
+                            help='id магазина, можно указать несколько раз')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='число параллельных воркеров')
+        parser.add_argument('--max-writers', type=int, default=None,
+                            help='сколько импортов одновременно пишут в БД')
+        parser.add_argument('--threads', action='store_true',
+                            help='использовать потоки вместо процессов')
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if options['sources']:
+            shops = [(None, source, source) for source in options['sources']]
+        else:
+            shops = Shop.objects.exclude(url__isnull=True).exclude(url='')
+            if options['shops']:
+                shops = shops.filter(id__in=options['shops'])
+            shops = list(shops.values_list('id', 'name', 'url'))
+        if not shops:
+            self.stdout.write('Нет магазинов для импорта')
+            return
+
+        workers = max(1, min(options['workers'], len(shops)))
+        max_writers = options['max_writers'] or workers
+        if options['threads']:
+            executor = ThreadPoolExecutor(workers, initializer=init_worker,
+                                          initargs=(threading.BoundedSemaphore(max_writers),))
+        else:
+            # соединения закрываем до форка, чтобы воркеры не делили сокет с родителем
+            connections.close_all()
+            executor = ProcessPoolExecutor(workers, initializer=init_worker,
+                                           initargs=(multiprocessing.BoundedSemaphore(max_writers),))
+
+        started = perf_counter()
+        results = []
+        with executor:
+            futures = [executor.submit(import_shop, shop_id, name, url, options['batch_size'])
+                       for shop_id, name, url in shops]
+            for future in as_completed(futures):
+                result = future.result()
+                results.append(result)
+                self.print_result(result)
+
+        seconds = perf_counter() - started
+        goods = sum(result.get('goods', 0) for result in results)
+        failed = sum(1 for result in results if 'error' in result)
+        self.stdout.write(self.style.SUCCESS(
+            f'Магазинов: {len(results)}, с ошибками: {failed}, товаров: {goods}, '
+            f'время: {seconds:.2f} c, товаров в секунду: {goods / seconds if seconds else 0:.1f}'))
+
+    def print_result(self, result):
+        line = f'[{result["shop_id"] or "-"}] {result["name"]}: {result["seconds"]:.2f} c'
+        if 'error' in result:
+            self.stdout.write(self.style.ERROR(f'{line}, ошибка: {result["error"]}'))
+        elif result['skipped']:
+            self.stdout.write(f'{line}, пропущен ({result["skipped"]})')
+        else:
+            self.stdout.write(f'{line}, товаров: {result["goods"]}, создано: {result["created"]}, '
+                              f'обновлено: {result["updated"]}, удалено: {result["deleted"]}')
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from shops.catalog import rebuild_catalog
+from shops.models import CatalogEntry
+
+
+class Command(BaseCommand):
+    help = 'Полная пересборка каталога для поиска товаров'
+
+    def handle(self, *args, **options):
+        rebuild_catalog()
+        self.stdout.write(self.style.SUCCESS(f'В каталоге {CatalogEntry.objects.count()} предложений'))
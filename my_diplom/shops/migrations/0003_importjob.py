@@ -0,0 +1,40 @@
+# Generated by Django 4.1.5 on 2026-10-18 20:02
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('shops', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.URLField(verbose_name='Ссылка')),
+                ('task_id', models.CharField(blank=True, max_length=50)),
+                ('state', models.CharField(choices=[('queued', 'В очереди'), ('downloading', 'Загрузка прайса'), ('importing', 'Импорт товаров'), ('done', 'Завершен'), ('failed', 'Ошибка')], default='queued', max_length=15, verbose_name='Статус импорта')),
+                ('goods', models.PositiveIntegerField(default=0, verbose_name='Обработано товаров')),
+                ('rows_per_sec', models.FloatField(default=0, verbose_name='Товаров в секунду')),
+                ('error', models.TextField(blank=True, verbose_name='Ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='import_jobs', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Задача импорта',
+                'verbose_name_plural': 'Задачи импорта',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='importjob',
+            constraint=models.UniqueConstraint(condition=models.Q(('state__in', ('queued', 'downloading', 'importing'))), fields=('user',), name='unique_active_import_job'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.1.5 on 2026-10-18 20:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shops', '0003_importjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productinfo',
+            name='external_id',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Внешний ИД'),
+        ),
+        migrations.AddConstraint(
+            model_name='productinfo',
+            constraint=models.UniqueConstraint(fields=('shop', 'external_id'), name='unique_product_info_external_id'),
+        ),
+    ]
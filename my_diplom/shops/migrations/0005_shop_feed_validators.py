@@ -0,0 +1,33 @@
+# Generated by Django 4.1.5 on 2026-10-18 20:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shops', '0004_productinfo_external_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shop',
+            name='feed_etag',
+            field=models.CharField(blank=True, max_length=255, verbose_name='ETag прайса'),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='feed_hash',
+            field=models.CharField(blank=True, max_length=64, verbose_name='Хеш прайса'),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='feed_last_modified',
+            field=models.CharField(blank=True, max_length=50, verbose_name='Дата изменения прайса'),
+        ),
+        migrations.AlterField(
+            model_name='importjob',
+            name='state',
+            field=models.CharField(choices=[('queued', 'В очереди'), ('downloading', 'Загрузка прайса'), ('importing', 'Импорт товаров'), ('done', 'Завершен'), ('skipped', 'Прайс не изменился'), ('failed', 'Ошибка')], default='queued', max_length=15, verbose_name='Статус импорта'),
+        ),
+    ]
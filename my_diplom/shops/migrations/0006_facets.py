@@ -0,0 +1,64 @@
+# Generated by Django 4.1.5 on 2026-10-18 20:13
+
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.deletion
+
+
+def fill_facets(apps, schema_editor):
+    # заполняем таблицу фасетов для уже загруженных прайсов
+    Facet = apps.get_model('shops', 'Facet')
+    ProductParameter = apps.get_model('shops', 'ProductParameter')
+    counts = ProductParameter.objects.values(
+        'product_info__shop_id', 'product_info__product__category_id', 'parameter_id', 'value').annotate(
+        count=Count('id')).order_by()
+    Facet.objects.bulk_create([Facet(shop_id=row['product_info__shop_id'],
+                                     category_id=row['product_info__product__category_id'],
+                                     parameter_id=row['parameter_id'], value=row['value'], count=row['count'])
+                               for row in counts.iterator()], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shops', '0005_shop_feed_validators'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Facet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.CharField(max_length=50, verbose_name='Значение')),
+                ('count', models.PositiveIntegerField(verbose_name='Количество предложений')),
+            ],
+            options={
+                'verbose_name': 'Фасет',
+                'verbose_name_plural': 'Фасеты',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='productparameter',
+            index=models.Index(fields=['parameter', 'value', 'product_info'], name='product_parameter_value_idx'),
+        ),
+        migrations.AddField(
+            model_name='facet',
+            name='category',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='facets', to='shops.category', verbose_name='Категория'),
+        ),
+        migrations.AddField(
+            model_name='facet',
+            name='parameter',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='facets', to='shops.parameter', verbose_name='Параметр'),
+        ),
+        migrations.AddField(
+            model_name='facet',
+            name='shop',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='facets', to='shops.shop', verbose_name='Магазин'),
+        ),
+        migrations.AddConstraint(
+            model_name='facet',
+            constraint=models.UniqueConstraint(fields=('shop', 'category', 'parameter', 'value'), name='unique_facet'),
+        ),
+        migrations.RunPython(fill_facets, migrations.RunPython.noop),
+    ]
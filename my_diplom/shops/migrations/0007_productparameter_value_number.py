@@ -0,0 +1,42 @@
+# Generated by Django 4.1.5 on 2026-10-18 20:14
+
+import re
+
+from django.db import migrations, models
+
+NUMBER = re.compile(r'^-?\d+([.,]\d+)?$')
+
+
+def fill_numbers(apps, schema_editor):
+    # числовые значения для уже загруженных параметров
+    ProductParameter = apps.get_model('shops', 'ProductParameter')
+    batch = []
+    for parameter in ProductParameter.objects.only('id', 'value').iterator(chunk_size=2000):
+        value = parameter.value.strip()
+        if NUMBER.match(value):
+            parameter.value_number = float(value.replace(',', '.'))
+            batch.append(parameter)
+        if len(batch) >= 1000:
+            ProductParameter.objects.bulk_update(batch, ['value_number'])
+            batch = []
+    ProductParameter.objects.bulk_update(batch, ['value_number'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shops', '0006_facets'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productparameter',
+            name='value_number',
+            field=models.FloatField(blank=True, null=True, verbose_name='Числовое значение'),
+        ),
+        migrations.AddIndex(
+            model_name='productparameter',
+            index=models.Index(condition=models.Q(('value_number__isnull', False)), fields=['parameter', 'value_number', 'product_info'], name='product_parameter_number_idx'),
+        ),
+        migrations.RunPython(fill_numbers, migrations.RunPython.noop),
+    ]
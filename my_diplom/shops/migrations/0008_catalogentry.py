@@ -0,0 +1,99 @@
+# Generated by Django 4.1.5 on 2026-10-18 20:16
+
+from django.db import migrations, models
+import django.contrib.postgres.search
+import django.db.models.deletion
+
+
+def fill_catalog(apps, schema_editor):
+    # собираем каталог из уже загруженных предложений
+    CatalogEntry = apps.get_model('shops', 'CatalogEntry')
+    ProductInfo = apps.get_model('shops', 'ProductInfo')
+    ProductParameter = apps.get_model('shops', 'ProductParameter')
+    ids = list(ProductInfo.objects.order_by('id').values_list('id', flat=True))
+    for start in range(0, len(ids), 1000):
+        batch = ids[start:start + 1000]
+        parameters = {}
+        for row in ProductParameter.objects.filter(product_info_id__in=batch).values(
+                'product_info_id', 'parameter__name', 'value').order_by('id'):
+            parameters.setdefault(row['product_info_id'], []).append(
+                {'parameter': row['parameter__name'], 'value': row['value']})
+        CatalogEntry.objects.bulk_create([
+            CatalogEntry(product_info_id=info.id, shop_id=info.shop_id, shop_name=info.shop.name,
+                         shop_state=info.shop.state, category_id=info.product.category_id,
+                         category_name=info.product.category.name, product_id=info.product_id,
+                         product_name=info.product.name, external_id=info.external_id, name=info.name,
+                         quantity=info.quantity, price=info.price, price_rrc=info.price_rrc,
+                         parameters=parameters.get(info.id, []))
+            for info in ProductInfo.objects.filter(id__in=batch).select_related('shop', 'product__category')])
+
+
+def create_search_index(apps, schema_editor):
+    """
+    GIN-индекс и начальное заполнение поискового вектора каталога, только для PostgreSQL
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'CREATE INDEX shops_catalogentry_search_gin ON shops_catalogentry USING gin (search_vector)')
+    schema_editor.execute(
+        "UPDATE shops_catalogentry SET search_vector = "
+        "setweight(to_tsvector('russian', coalesce(product_name, '')), 'A') || "
+        "setweight(to_tsvector('russian', coalesce(name, '')), 'B')")
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS shops_catalogentry_search_gin')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shops', '0007_productparameter_value_number'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogEntry',
+            fields=[
+                ('product_info', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='catalog_entry', serialize=False, to='shops.productinfo', verbose_name='Информация о продукте')),
+                ('shop_name', models.CharField(max_length=50, verbose_name='Название магазина')),
+                ('shop_state', models.BooleanField(default=True, verbose_name='статус получения заказов')),
+                ('category_name', models.CharField(max_length=50, verbose_name='Название категории')),
+                ('product_name', models.CharField(max_length=50, verbose_name='Название продукта')),
+                ('external_id', models.PositiveIntegerField(blank=True, null=True, verbose_name='Внешний ИД')),
+                ('name', models.CharField(max_length=50, verbose_name='Модель')),
+                ('quantity', models.PositiveIntegerField(verbose_name='Количество')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=9, verbose_name='Стоимость')),
+                ('price_rrc', models.DecimalField(decimal_places=2, max_digits=9, verbose_name='Рекомендуемая цена')),
+                ('parameters', models.JSONField(default=list, verbose_name='Параметры')),
+                ('search_vector', django.contrib.postgres.search.SearchVectorField(editable=False, null=True)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='catalog_entries', to='shops.category', verbose_name='Категория')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='catalog_entries', to='shops.product', verbose_name='Продукт')),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='catalog_entries', to='shops.shop', verbose_name='Магазин')),
+            ],
+            options={
+                'verbose_name': 'Запись каталога',
+                'verbose_name_plural': 'Каталог',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='catalogentry',
+            index=models.Index(fields=['shop', 'price', 'product_info'], name='catalog_shop_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='catalogentry',
+            index=models.Index(fields=['category', 'price', 'product_info'], name='catalog_category_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='catalogentry',
+            index=models.Index(fields=['price', 'product_info'], name='catalog_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='catalogentry',
+            index=models.Index(fields=['name', 'product_info'], name='catalog_name_idx'),
+        ),
+        migrations.RunPython(fill_catalog, migrations.RunPython.noop),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 4.1.5 on 2026-10-18 20:47
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def merge_duplicates(apps, schema_editor):
+    # параллельные импорты могли создать одинаковые параметры и продукты,
+    # ссылки переводим на запись с наименьшим id, а дубли удаляем
+    Parameter = apps.get_model('shops', 'Parameter')
+    Product = apps.get_model('shops', 'Product')
+    ProductInfo = apps.get_model('shops', 'ProductInfo')
+    ProductParameter = apps.get_model('shops', 'ProductParameter')
+    CatalogEntry = apps.get_model('shops', 'CatalogEntry')
+    OrderItem = apps.get_model('orders', 'OrderItem')
+    Facet = apps.get_model('shops', 'Facet')
+
+    merged_parameters = False
+    for row in Parameter.objects.values('name').annotate(count=Count('id'), keep=Min('id')).filter(
+            count__gt=1).order_by():
+        duplicates = Parameter.objects.filter(name=row['name']).exclude(id=row['keep'])
+        ProductParameter.objects.filter(parameter__in=duplicates, product_info__in=ProductParameter.objects.filter(
+            parameter_id=row['keep']).values('product_info')).delete()
+        ProductParameter.objects.filter(parameter__in=duplicates).update(parameter_id=row['keep'])
+        duplicates.delete()
+        merged_parameters = True
+
+    for row in Product.objects.values('name', 'category').annotate(count=Count('id'), keep=Min('id')).filter(
+            count__gt=1).order_by():
+        duplicates = Product.objects.filter(name=row['name'], category=row['category']).exclude(id=row['keep'])
+        kept = dict(ProductInfo.objects.filter(product_id=row['keep']).values_list('shop_id', 'id'))
+        colliding = ProductInfo.objects.filter(product__in=duplicates, shop_id__in=kept)
+        # позиции заказов переводим на оставшееся предложение магазина до удаления дубля
+        for item in OrderItem.objects.filter(product_info__in=colliding).select_related('product_info'):
+            target = kept[item.product_info.shop_id]
+            existing = OrderItem.objects.filter(order_id=item.order_id, product_info_id=target).first()
+            if existing:
+                existing.quantity += item.quantity
+                existing.save(update_fields=['quantity'])
+                item.delete()
+            else:
+                item.product_info_id = target
+                item.save(update_fields=['product_info'])
+        colliding.delete()
+        ProductInfo.objects.filter(product__in=duplicates).update(product_id=row['keep'])
+        CatalogEntry.objects.filter(product__in=duplicates).update(product_id=row['keep'])
+        duplicates.delete()
+
+    if merged_parameters:
+        # счетчики фасетов удаленных параметров собираем заново
+        Facet.objects.all().delete()
+        counts = ProductParameter.objects.values(
+            'product_info__shop_id', 'product_info__product__category_id', 'parameter_id', 'value').annotate(
+            count=Count('id')).order_by()
+        Facet.objects.bulk_create([Facet(shop_id=row['product_info__shop_id'],
+                                         category_id=row['product_info__product__category_id'],
+                                         parameter_id=row['parameter_id'], value=row['value'], count=row['count'])
+                                   for row in counts.iterator()], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shops', '0008_catalogentry'),
+        ('orders', '0004_order_totals'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+    ]
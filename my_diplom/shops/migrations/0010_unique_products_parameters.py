@@ -0,0 +1,23 @@
+# Generated by Django 4.1.5 on 2026-10-18 20:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # ограничения добавляются отдельной миграцией после слияния дублей:
+    # PostgreSQL не меняет таблицу, пока в той же транзакции есть отложенные проверки ключей
+    dependencies = [
+        ('shops', '0009_merge_duplicate_lookups'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='parameter',
+            constraint=models.UniqueConstraint(fields=('name',), name='unique_parameter_name'),
+        ),
+        migrations.AddConstraint(
+            model_name='product',
+            constraint=models.UniqueConstraint(fields=('name', 'category'), name='unique_product'),
+        ),
+    ]
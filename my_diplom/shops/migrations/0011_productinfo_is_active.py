@@ -0,0 +1,18 @@
+# Generated by Django 4.1.5 on 2026-10-18 21:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shops', '0010_unique_products_parameters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productinfo',
+            name='is_active',
+            field=models.BooleanField(default=True, verbose_name='Есть в прайсе'),
+        ),
+    ]
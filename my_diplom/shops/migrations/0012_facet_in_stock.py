@@ -0,0 +1,59 @@
+# Generated by Django 4.1.5 on 2026-10-18 21:11
+
+from django.db import migrations, models
+from django.db.models import BooleanField, Count, ExpressionWrapper, Q
+
+
+def split_facets(apps, schema_editor):
+    # разделяем счетчики уже загруженных прайсов по наличию
+    Facet = apps.get_model('shops', 'Facet')
+    ProductParameter = apps.get_model('shops', 'ProductParameter')
+    Facet.objects.all().delete()
+    counts = ProductParameter.objects.filter(product_info__is_active=True).annotate(
+        in_stock=ExpressionWrapper(Q(product_info__quantity__gt=0), output_field=BooleanField())).values(
+        'product_info__shop_id', 'product_info__product__category_id', 'parameter_id', 'value', 'in_stock').annotate(
+        count=Count('id')).order_by()
+    Facet.objects.bulk_create([Facet(shop_id=row['product_info__shop_id'],
+                                     category_id=row['product_info__product__category_id'],
+                                     parameter_id=row['parameter_id'], value=row['value'], in_stock=row['in_stock'],
+                                     count=row['count'])
+                               for row in counts.iterator()], batch_size=1000)
+
+
+def merge_facets(apps, schema_editor):
+    # обратно к одному счетчику на значение, иначе не создать прежнее ограничение
+    Facet = apps.get_model('shops', 'Facet')
+    ProductParameter = apps.get_model('shops', 'ProductParameter')
+    Facet.objects.all().delete()
+    counts = ProductParameter.objects.filter(product_info__is_active=True).values(
+        'product_info__shop_id', 'product_info__product__category_id', 'parameter_id', 'value').annotate(
+        count=Count('id')).order_by()
+    Facet.objects.bulk_create([Facet(shop_id=row['product_info__shop_id'],
+                                     category_id=row['product_info__product__category_id'],
+                                     parameter_id=row['parameter_id'], value=row['value'], count=row['count'])
+                               for row in counts.iterator()], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shops', '0011_productinfo_is_active'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='facet',
+            name='unique_facet',
+        ),
+        migrations.AddField(
+            model_name='facet',
+            name='in_stock',
+            field=models.BooleanField(default=True, verbose_name='В наличии'),
+        ),
+        migrations.AddConstraint(
+            model_name='facet',
+            constraint=models.UniqueConstraint(fields=('shop', 'category', 'parameter', 'value', 'in_stock'), name='unique_facet'),
+        ),
+        # данные меняются последней операцией, после изменения схемы
+        migrations.RunPython(split_facets, merge_facets),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from django.core.validators import MinValueValidator
+from django.contrib.postgres.search import SearchVectorField
 
 from users.models import User
 
@@ -15,6 +16,9 @@ class Shop(models.Model):
         blank=True
     )
     filename = models.CharField(max_length=50, blank=True)
+    feed_etag = models.CharField(verbose_name='ETag прайса', max_length=255, blank=True)
+    feed_last_modified = models.CharField(verbose_name='Дата изменения прайса', max_length=50, blank=True)
+    feed_hash = models.CharField(verbose_name='Хеш прайса', max_length=64, blank=True)
     user = models.OneToOneField(
         User,
         verbose_name='Пользователь',
@@ -77,12 +81,20 @@ class Product(models.Model):
         verbose_name = 'Продукт'
         verbose_name_plural = 'Продукты'
         ordering = ['-name']
+        constraints = [
+            models.UniqueConstraint(fields=['name', 'category'], name='unique_product'),
+        ]
 
     def __str__(self):
         return self.name
 
 
 class ProductInfo(models.Model):
+    external_id = models.PositiveIntegerField(
+        verbose_name='Внешний ИД',
+        blank=True,
+        null=True
+    )
     name = models.CharField(
         max_length=50,
         verbose_name='Модель'
@@ -110,6 +122,9 @@ class ProductInfo(models.Model):
         related_name='product_info',
         on_delete=models.CASCADE
     )
+    # предложение пропало из прайса: оно скрыто из каталога,
+    # но позиции заказов на него остаются
+    is_active = models.BooleanField(verbose_name='Есть в прайсе', default=True)
 
     class Meta:
         verbose_name = 'Информация о продукте'
@@ -117,6 +132,7 @@ class ProductInfo(models.Model):
         ordering = ['-name']
         constraints = [
             models.UniqueConstraint(fields=['product', 'shop'], name='unique_product_info'),
+            models.UniqueConstraint(fields=['shop', 'external_id'], name='unique_product_info_external_id'),
         ]
 
     def __str__(self):
@@ -133,6 +149,9 @@ class Parameter(models.Model):
         verbose_name = 'Имя параметра'
         verbose_name_plural = "Список имен параметров"
         ordering = ['-name']
+        constraints = [
+            models.UniqueConstraint(fields=['name'], name='unique_parameter_name'),
+        ]
 
     def __str__(self):
         return self.name
@@ -157,6 +176,12 @@ class ProductParameter(models.Model):
         verbose_name='Значение',
         max_length=50
     )
+    # заполняется при импорте, если значение - число
+    value_number = models.FloatField(
+        verbose_name='Числовое значение',
+        blank=True,
+        null=True
+    )
 
     class Meta:
         verbose_name = 'Параметр'
@@ -164,4 +189,148 @@ class ProductParameter(models.Model):
         constraints = [
             models.UniqueConstraint(fields=['product_info', 'parameter'], name='unique_product_parameter'),
         ]
+        indexes = [
+            # инвертированный индекс: значение параметра -> предложения
+            models.Index(fields=['parameter', 'value', 'product_info'], name='product_parameter_value_idx'),
+            # диапазоны по числовым значениям
+            models.Index(fields=['parameter', 'value_number', 'product_info'], name='product_parameter_number_idx',
+                         condition=models.Q(value_number__isnull=False)),
+        ]
 
+
+class Facet(models.Model):
+    shop = models.ForeignKey(
+        Shop, verbose_name='Магазин',
+        related_name='facets',
+        on_delete=models.CASCADE
+    )
+    category = models.ForeignKey(
+        Category, verbose_name='Категория',
+        related_name='facets',
+        on_delete=models.CASCADE
+    )
+    parameter = models.ForeignKey(
+        Parameter,
+        verbose_name='Параметр',
+        related_name='facets',
+        on_delete=models.CASCADE
+    )
+    value = models.CharField(
+        verbose_name='Значение',
+        max_length=50
+    )
+    # счетчики предложений в наличии и без остатка хранятся отдельно,
+    # чтобы фильтр "в наличии" тоже читал предрассчитанную таблицу
+    in_stock = models.BooleanField(verbose_name='В наличии', default=True)
+    count = models.PositiveIntegerField(verbose_name='Количество предложений')
+
+    class Meta:
+        verbose_name = 'Фасет'
+        verbose_name_plural = 'Фасеты'
+        constraints = [
+            models.UniqueConstraint(fields=['shop', 'category', 'parameter', 'value', 'in_stock'],
+                                    name='unique_facet'),
+        ]
+
+    def __str__(self):
+        return f'{self.parameter}: {self.value}'
+
+
+class CatalogEntry(models.Model):
+    """
+    Плоская запись каталога для поиска товаров: одно предложение со всеми
+    данными магазина, продукта, категории и параметрами в JSON.
+    Обновляется при импорте прайса и смене статуса магазина
+    """
+    product_info = models.OneToOneField(
+        ProductInfo,
+        verbose_name='Информация о продукте',
+        related_name='catalog_entry',
+        primary_key=True,
+        on_delete=models.CASCADE
+    )
+    shop = models.ForeignKey(
+        Shop, verbose_name='Магазин',
+        related_name='catalog_entries',
+        on_delete=models.CASCADE
+    )
+    shop_name = models.CharField(max_length=50, verbose_name='Название магазина')
+    shop_state = models.BooleanField(verbose_name='статус получения заказов', default=True)
+    category = models.ForeignKey(
+        Category, verbose_name='Категория',
+        related_name='catalog_entries',
+        on_delete=models.CASCADE
+    )
+    category_name = models.CharField(max_length=50, verbose_name='Название категории')
+    product = models.ForeignKey(
+        Product, verbose_name='Продукт',
+        related_name='catalog_entries',
+        on_delete=models.CASCADE
+    )
+    product_name = models.CharField(max_length=50, verbose_name='Название продукта')
+    external_id = models.PositiveIntegerField(verbose_name='Внешний ИД', blank=True, null=True)
+    name = models.CharField(max_length=50, verbose_name='Модель')
+    quantity = models.PositiveIntegerField(verbose_name='Количество')
+    price = models.DecimalField(max_digits=9, decimal_places=2, verbose_name='Стоимость')
+    price_rrc = models.DecimalField(max_digits=9, decimal_places=2, verbose_name='Рекомендуемая цена')
+    parameters = models.JSONField(verbose_name='Параметры', default=list)
+    # заполняется при обновлении каталога, GIN-индекс создается миграцией только в PostgreSQL
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        verbose_name = 'Запись каталога'
+        verbose_name_plural = 'Каталог'
+        indexes = [
+            models.Index(fields=['shop', 'price', 'product_info'], name='catalog_shop_price_idx'),
+            models.Index(fields=['category', 'price', 'product_info'], name='catalog_category_price_idx'),
+            models.Index(fields=['price', 'product_info'], name='catalog_price_idx'),
+            models.Index(fields=['name', 'product_info'], name='catalog_name_idx'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class ImportJob(models.Model):
+    STATE_CHOICES = (
+        ('queued', 'В очереди'),
+        ('downloading', 'Загрузка прайса'),
+        ('importing', 'Импорт товаров'),
+        ('done', 'Завершен'),
+        ('skipped', 'Прайс не изменился'),
+        ('failed', 'Ошибка'),
+    )
+    ACTIVE_STATES = ('queued', 'downloading', 'importing')
+    user = models.ForeignKey(
+        User,
+        verbose_name='Пользователь',
+        related_name='import_jobs',
+        on_delete=models.CASCADE
+    )
+    url = models.URLField(verbose_name='Ссылка')
+    task_id = models.CharField(max_length=50, blank=True)
+    state = models.CharField(
+        verbose_name='Статус импорта',
+        choices=STATE_CHOICES,
+        max_length=15,
+        default='queued'
+    )
+    goods = models.PositiveIntegerField(verbose_name='Обработано товаров', default=0)
+    rows_per_sec = models.FloatField(verbose_name='Товаров в секунду', default=0)
+    error = models.TextField(verbose_name='Ошибка', blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Задача импорта'
+        verbose_name_plural = 'Задачи импорта'
+        ordering = ['-created_at']
+        constraints = [
+            # для одного поставщика одновременно выполняется только один импорт
+            models.UniqueConstraint(fields=['user'],
+                                    condition=models.Q(state__in=('queued', 'downloading', 'importing')),
+                                    name='unique_active_import_job'),
+        ]
+
+    def __str__(self):
+        return f'{self.state} {self.url}'
@@ -0,0 +1,125 @@
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ParseError
+from rest_framework.pagination import CursorPagination
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Постраничный вывод по курсору (keyset).
+    Позиция курсора - значения всех полей сортировки последней записи,
+    следующая страница выбирается условием (a > x) OR (a = x AND b > y) по индексу,
+    без OFFSET и COUNT(*), поэтому любая страница стоит столько же, сколько первая.
+    Последним полем сортировки должен быть уникальный ключ.
+    Испорченный курсор - ошибка запроса (400)
+    """
+    ordering = ('id',)
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            (offset, reverse, current_position) = (0, False, None)
+        else:
+            (offset, reverse, current_position) = self.cursor
+
+        if reverse:
+            queryset = queryset.order_by(*[field[1:] if field.startswith('-') else f'-{field}'
+                                           for field in self.ordering])
+        else:
+            queryset = queryset.order_by(*self.ordering)
+
+        if current_position is not None:
+            try:
+                queryset = queryset.filter(self.keyset_filter(current_position, reverse))
+            except (TypeError, ValueError, ValidationError):
+                # значения позиции не подходят к типам полей сортировки
+                raise ParseError(self.invalid_cursor_message)
+
+        results = list(queryset[offset:offset + self.page_size + 1])
+        self.page = list(results[:self.page_size])
+
+        if len(results) > len(self.page):
+            has_following_position = True
+            following_position = self._get_position_from_instance(results[-1], self.ordering)
+        else:
+            has_following_position = False
+            following_position = None
+
+        if reverse:
+            self.page = list(reversed(self.page))
+            self.has_next = (current_position is not None) or (offset > 0)
+            self.has_previous = has_following_position
+            if self.has_next:
+                self.next_position = current_position
+            if self.has_previous:
+                self.previous_position = following_position
+        else:
+            self.has_next = has_following_position
+            self.has_previous = (current_position is not None) or (offset > 0)
+            if self.has_next:
+                self.next_position = following_position
+            if self.has_previous:
+                self.previous_position = current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
+
+    def decode_cursor(self, request):
+        try:
+            return super().decode_cursor(request)
+        except NotFound:
+            raise ParseError(self.invalid_cursor_message)
+
+    def keyset_filter(self, position, reverse):
+        """
+        Условие "строго после позиции" в порядке сортировки:
+        (a > x) OR (a = x AND b > y) OR ...
+        """
+        try:
+            values = json.loads(position)
+        except ValueError:
+            values = None
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise ParseError(self.invalid_cursor_message)
+
+        condition = Q(pk__in=[])
+        equal = Q()
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip('-')
+            lookup = '__lt' if field.startswith('-') != reverse else '__gt'
+            condition |= equal & Q(**{name + lookup: value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def _get_position_from_instance(self, instance, ordering):
+        values = [instance[field.lstrip('-')] if isinstance(instance, dict) else getattr(instance, field.lstrip('-'))
+                  for field in ordering]
+        return json.dumps(values, cls=DjangoJSONEncoder)
+
+
+class ProductInfoPagination(KeysetPagination):
+    """
+    Постраничный вывод товаров каталога, по умолчанию по первичному ключу
+    """
+    ordering = ('pk',)
+    # допустимые значения параметра ordering
+    orderings = {
+        'price': ('price', 'pk'),
+        # ключ курсора в том же направлении, что и цена: страницу читает обратный проход индекса
+        '-price': ('-price', '-pk'),
+        'name': ('name', 'pk'),
+    }
@@ -0,0 +1,52 @@
+import re
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.functions import Cast
+
+SEARCH_CONFIG = getattr(settings, 'SEARCH_CONFIG', 'russian')
+
+
+def is_postgresql():
+    return connection.vendor == 'postgresql'
+
+
+def catalog_search_vector():
+    """
+    Поисковый вектор записи каталога: название продукта (вес A) и модель (вес B)
+    """
+    return (SearchVector('product_name', weight='A', config=SEARCH_CONFIG) +
+            SearchVector('name', weight='B', config=SEARCH_CONFIG))
+
+
+def update_search_vectors(queryset):
+    """
+    Пересчитываем поисковый вектор для выбранных записей каталога одним запросом.
+    Колонка search_vector есть только в PostgreSQL
+    """
+    if is_postgresql():
+        queryset.update(search_vector=catalog_search_vector())
+
+
+def search_catalog(queryset, text):
+    """
+    Полнотекстовый поиск по каталогу с ранжированием, читается одна таблица.
+    Каждое слово запроса ищется как префикс: "iphone 256" -> iphone:* & 256:*.
+    На других БД (SQLite в тестах) - поиск подстрок по названиям
+    """
+    words = re.findall(r'\w+', text.lower())
+    if not words:
+        return queryset.annotate(rank=Value(0.0, output_field=FloatField()))
+
+    if is_postgresql():
+        query = SearchQuery(' & '.join(f'{word}:*' for word in words), search_type='raw', config=SEARCH_CONFIG)
+        # ts_rank возвращает real, а курсор хранит ранг как double precision: без приведения
+        # сравнение с позицией курсора теряет или повторяет строки с одинаковым рангом
+        rank = Cast(SearchRank(F('search_vector'), query), FloatField())
+        return queryset.filter(search_vector=query).annotate(rank=rank)
+
+    for word in words:
+        queryset = queryset.filter(Q(product_name__icontains=word) | Q(name__icontains=word))
+    return queryset.annotate(rank=Value(1.0, output_field=FloatField()))
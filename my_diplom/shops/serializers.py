@@ -1,11 +1,14 @@
+from decimal import Decimal
+
 from rest_framework import serializers
-from shops.models import Shop, Category, Product, ProductParameter, ProductInfo
+from shops.models import Shop, Category, Product, ProductParameter, ProductInfo, ImportJob
 
 
 class ShopSerializer(serializers.ModelSerializer):
     class Meta:
         model = Shop
-        fields = '__all__'
+        # валидаторы прайса нужны только импорту
+        exclude = ('feed_etag', 'feed_last_modified', 'feed_hash')
         read_only_fields = ('id',)
 
 
@@ -43,3 +46,111 @@ class ProductInfoSerializer(serializers.ModelSerializer):
         model = ProductInfo
         fields = '__all__'
         read_only_fields = ('id',)
+
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ImportJob
+        exclude = ('user', 'task_id',)
+        read_only_fields = ('id',)
+
+
+# Быстрая сериализация: строки values() собираются в словари того же вида,
+# что и у сериализаторов выше, без создания объектов моделей и полей DRF
+CENTS = Decimal('0.01')
+# поля предложения в ответе и колонки, из которых они берутся
+OFFER_OUTPUT = {'external_id': 'external_id', 'name': 'name', 'quantity': 'quantity', 'price': 'price',
+                'price_rrc': 'price_rrc', 'shop': 'shop_id'}
+DECIMAL_FIELDS = ('price', 'price_rrc')
+# связи, которые раскрываются по ?expand=
+EXPANSIONS = ('product', 'parameters')
+CATALOG_EXPANSIONS = {'product': ('product_id', 'category_name', 'product_name'), 'parameters': ('parameters',)}
+PRODUCT_INFO_EXPANSIONS = {'product': ('product_id', 'product__category__name', 'product__name'), 'parameters': ()}
+
+
+def decimal_to_string(value):
+    return None if value is None else f'{Decimal(value).quantize(CENTS):f}'
+
+
+def parse_list(query_params, name, allowed):
+    value = query_params.get(name)
+    if value is None:
+        return None
+    items = [item.strip() for item in value.split(',') if item.strip()]
+    unknown = set(items) - set(allowed)
+    if unknown:
+        raise ValueError(f'Неизвестные значения {name}: {", ".join(sorted(unknown))}')
+    return items
+
+
+def parse_fieldset(query_params, fields):
+    """
+    Поля ответа из ?fields= и раскрываемые связи из ?expand=.
+    Без обоих параметров отдается полный ответ, id есть всегда
+    """
+    selected = parse_list(query_params, 'fields', ('id', *fields))
+    expand = parse_list(query_params, 'expand', EXPANSIONS)
+    if selected is None and expand is None:
+        return tuple(fields), set(EXPANSIONS)
+    if selected is not None:
+        fields = tuple(field for field in fields if field in selected)
+    return fields, set(expand or ())
+
+
+def offer_fields(row, fields):
+    return {field: decimal_to_string(row[OFFER_OUTPUT[field]]) if field in DECIMAL_FIELDS
+            else row[OFFER_OUTPUT[field]] for field in fields}
+
+
+def catalog_columns(fields=tuple(OFFER_OUTPUT), expand=EXPANSIONS):
+    """
+    Колонки каталога для values(), нужные выбранным полям и связям
+    """
+    return ('pk', *(column for name in EXPANSIONS if name in expand for column in CATALOG_EXPANSIONS[name]),
+            *(OFFER_OUTPUT[field] for field in fields))
+
+
+CATALOG_FIELDS = catalog_columns()
+
+
+def serialize_catalog_rows(rows, fields=tuple(OFFER_OUTPUT), expand=EXPANSIONS):
+    """
+    Записи каталога из values(*catalog_columns(fields, expand)) в виде ProductInfoSerializer
+    """
+    result = []
+    for row in rows:
+        item = {'id': row['pk']}
+        if 'product' in expand:
+            item['product'] = {'id': row['product_id'], 'category': row['category_name'],
+                               'name': row['product_name']}
+        if 'parameters' in expand:
+            item['product_parameters'] = row['parameters']
+        item.update(offer_fields(row, fields))
+        result.append(item)
+    return result
+
+
+def serialize_product_infos(ids, expand=EXPANSIONS):
+    """
+    Предложения в виде ProductInfoSerializer: {id: данные}.
+    Продукт с категорией и параметры читаются, только если их нужно раскрыть
+    """
+    parameters = {}
+    if 'parameters' in expand:
+        for row in ProductParameter.objects.filter(product_info_id__in=ids).order_by('id').values_list(
+                'product_info_id', 'parameter__name', 'value'):
+            parameters.setdefault(row[0], []).append({'parameter': row[1], 'value': row[2]})
+
+    columns = ('id', *(column for name in EXPANSIONS if name in expand for column in PRODUCT_INFO_EXPANSIONS[name]),
+               *OFFER_OUTPUT.values())
+    product_infos = {}
+    for row in ProductInfo.objects.filter(id__in=ids).values(*columns):
+        item = {'id': row['id']}
+        if 'product' in expand:
+            item['product'] = {'id': row['product_id'], 'category': row['product__category__name'],
+                               'name': row['product__name']}
+        if 'parameters' in expand:
+            item['product_parameters'] = parameters.get(row['id'], [])
+        item.update(offer_fields(row, OFFER_OUTPUT))
+        product_infos[row['id']] = item
+    return product_infos
@@ -0,0 +1,111 @@
+from datetime import timedelta
+from time import time
+from uuid import uuid4
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from my_diplom.celery import app
+from shops.feeds import is_upload, local_path
+from shops.importer import import_url
+from shops.models import ImportJob
+
+IMPORT_JOB_TIMEOUT = getattr(settings, 'IMPORT_JOB_TIMEOUT', 60 * 60)
+
+
+def set_state(job_id, **fields):
+    """
+    Обновляем фазу и статистику задачи импорта
+    """
+    ImportJob.objects.filter(id=job_id).update(updated_at=timezone.now(), **fields)
+
+
+@app.task(bind=True)
+def do_import(self, job_id):
+    """
+    Фоновый импорт прайса поставщика.
+    Фаза и итоговая статистика сохраняются в ImportJob,
+    текущий прогресс по пакетам - в состоянии задачи celery
+    """
+    job = ImportJob.objects.get(id=job_id)
+
+    def progress(stats):
+        # импорт идет в одной транзакции, поэтому ImportJob до ее фиксации не меняется,
+        # и признак жизни воркера хранится в состоянии задачи celery
+        if not self.request.is_eager:
+            self.update_state(state='PROGRESS', meta={**stats, 'heartbeat': time()})
+
+    try:
+        set_state(job.id, state='downloading')
+        stats = import_url(job.url, progress=progress, phase=lambda state: set_state(job.id, state=state))
+    except Exception as error:
+        set_state(job.id, state='failed', error=str(error))
+        return {'Status': False, 'Error': str(error)}
+    finally:
+        # загруженный поставщиком файл после импорта больше не нужен
+        if is_upload(job.url):
+            local_path(job.url).unlink(missing_ok=True)
+
+    set_state(job.id, state='skipped' if stats['skipped'] else 'done', goods=stats['goods'],
+              rows_per_sec=stats['rows_per_sec'])
+    return stats
+
+
+def start_import(user_id, url):
+    """
+    Ставим импорт прайса в очередь.
+    Если у поставщика уже есть активный импорт, новая задача не создается
+    и возвращается уже выполняющаяся
+    """
+    # задачи, зависшие из-за упавшего воркера, не должны блокировать новые импорты,
+    # а долгий импорт, который еще сообщает о прогрессе, зависшим не считается
+    stale = timezone.now() - timedelta(seconds=IMPORT_JOB_TIMEOUT)
+    jobs = ImportJob.objects.filter(user_id=user_id, state__in=ImportJob.ACTIVE_STATES, updated_at__lt=stale)
+    stale_ids = [job.id for job in jobs if not is_alive(job)]
+    if stale_ids:
+        ImportJob.objects.filter(id__in=stale_ids, updated_at__lt=stale).update(
+            state='failed', error='Превышено время ожидания', updated_at=timezone.now())
+
+    task_id = str(uuid4())
+    try:
+        with transaction.atomic():
+            job = ImportJob.objects.create(user_id=user_id, url=url, task_id=task_id)
+    except IntegrityError:
+        return ImportJob.objects.filter(user_id=user_id, state__in=ImportJob.ACTIVE_STATES).first(), False
+
+    transaction.on_commit(lambda: do_import.apply_async((job.id,), task_id=task_id))
+    return job, True
+
+
+def task_info(job):
+    """
+    Метаданные задачи celery импорта или пустой словарь,
+    если задача еще не сообщала о прогрессе или бэкенд результатов недоступен
+    """
+    if not job.task_id:
+        return {}
+    try:
+        info = do_import.AsyncResult(job.task_id).info
+    except Exception:
+        return {}
+    return info if isinstance(info, dict) else {}
+
+
+def is_alive(job):
+    """
+    Воркер сообщал о прогрессе задачи не позже IMPORT_JOB_TIMEOUT назад
+    """
+    heartbeat = task_info(job).get('heartbeat')
+    return heartbeat is not None and time() - heartbeat < IMPORT_JOB_TIMEOUT
+
+
+def get_progress(job):
+    """
+    Текущий прогресс выполняющегося импорта из состояния задачи celery
+    """
+    if job.state != 'importing':
+        return {}
+    info = task_info(job)
+    info.pop('heartbeat', None)
+    return info
@@ -1,3 +1,826 @@
+import csv
+import gzip
+import json
+import os
+from base64 import b64encode
+from datetime import timedelta
+from io import BytesIO, StringIO
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from urllib.parse import urlencode
+from time import time
+from unittest.mock import patch
+
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.db.models import Q, QuerySet
+from django.http import QueryDict
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory, APITestCase
+
+from my_diplom.celery import app as celery_app
+from orders.basket import parse_basket_items
+from orders.models import Order, OrderItem
+from shops.cache import RESPONSE_CACHE_ALIAS, bump_generation, cache_stats, cached_response, get_cache, \
+    get_generation, response_key, should_refresh
+from shops.generator import EXTENSIONS, FORMATS, generate_goods, msgpack, write_csv, write_feed, write_jsonl
+from shops.importer import import_feed, import_url
+from shops.catalog import refresh_catalog
+from shops.facets import parse_param_filters, refresh_facets, value_condition
+from shops.models import CatalogEntry, Category, ImportJob, ProductInfo, ProductParameter, Shop
+from shops.tasks import get_progress, start_import
+from users.models import Contact, User
+
+# в тестах кэш ответов хранится в памяти процесса
+TEST_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'responses': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+}
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'], CACHES=TEST_CACHES)
+class QueryBudgetTestCase(APITestCase):
+    """
+    Базовый класс для проверки бюджета запросов.
+    Каждый запрос выполняется на двух объемах данных: число запросов к БД
+    должно совпадать и не превышать бюджет, а размер ответа - укладываться в лимит
+    """
+    scales = (20, 60)
+    # позиций в корзине и в каждом заказе покупателя
+    items = 5
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # письма и задачи celery выполняются сразу, без брокера
+        cls.task_always_eager = celery_app.conf.task_always_eager
+        celery_app.conf.task_always_eager = True
+
+    @classmethod
+    def tearDownClass(cls):
+        celery_app.conf.task_always_eager = cls.task_always_eager
+        super().tearDownClass()
+
+    def setUp(self):
+        self.partner = User.objects.create_user('partner@example.com', 'Partner-pass-123', type='shop',
+                                                is_active=True)
+        self.buyer = User.objects.create_user('buyer@example.com', 'Buyer-pass-123', is_active=True)
+
+    def seed(self, goods):
+        """
+        Загружаем прайсы двух магазинов на goods товаров и заполняем заказы.
+        Корзина, заказы и контакты покупателя не меняются, а магазины, категории
+        и заказы других покупателей растут вместе с goods
+        """
+        for name, seed in (('Тестовый магазин', 0), ('Другой магазин', 1)):
+            output = StringIO()
+            write_jsonl(output, name, generate_goods(goods, seed=seed))
+            import_feed(BytesIO(output.getvalue().encode()), filename='seed.jsonl')
+        Shop.objects.filter(name='Тестовый магазин').update(user=self.partner)
+
+        shops = Shop.objects.bulk_create([Shop(name=f'Магазин {goods}-{index}') for index in range(goods // 2)])
+        categories = Category.objects.bulk_create([Category(name=f'Категория {goods}-{index}')
+                                                   for index in range(goods // 2)])
+        Category.shops.through.objects.bulk_create([Category.shops.through(category_id=category.id, shop_id=shop.id)
+                                                    for category, shop in zip(categories, shops)])
+
+        own = list(ProductInfo.objects.filter(shop__name='Тестовый магазин').order_by('id')[:self.items])
+        other = list(ProductInfo.objects.filter(shop__name='Другой магазин').order_by('id')[:self.items])
+
+        basket, _ = Order.objects.get_or_create(user=self.buyer, state='basket')
+        OrderItem.objects.bulk_create([OrderItem(order=basket, product_info=product_info, quantity=2)
+                                       for product_info in own], ignore_conflicts=True)
+        if not Contact.objects.filter(user=self.buyer).exists():
+            for index in range(3):
+                contact = Contact.objects.create(user=self.buyer, city='Москва', street='Тверская',
+                                                 house=str(index + 1), apartment='1', phone='+79000000000')
+                order = Order.objects.create(user=self.buyer, state='new', contact=contact)
+                OrderItem.objects.bulk_create([OrderItem(order=order, product_info=product_info, quantity=index + 1)
+                                               for product_info in own])
+
+        # другие покупатели заказывают в другом магазине
+        others = User.objects.filter(email__startswith='other').count()
+        for index in range(others, goods // 5):
+            user = User.objects.create(email=f'other{index}@example.com', is_active=True)
+            contact = Contact.objects.create(user=user, city='Казань', street='Баумана', house='1',
+                                             phone='+79000000001')
+            order = Order.objects.create(user=user, state='new', contact=contact)
+            OrderItem.objects.bulk_create([OrderItem(order=order, product_info=product_info) for product_info in other])
+            basket = Order.objects.create(user=user, state='basket')
+            OrderItem.objects.bulk_create([OrderItem(order=basket, product_info=product_info)
+                                           for product_info in other])
+        # bulk_create не пересчитывает итоги заказов
+        Order.objects.refresh_totals()
+
+    def call(self, method, url, user=None, data=None, **extra):
+        """
+        Выполняем запрос с пустыми кэшами и возвращаем ответ, число запросов к БД и размер ответа
+        """
+        caches['default'].clear()
+        caches[RESPONSE_CACHE_ALIAS].clear()
+        # пользователь читается заново, чтобы не переиспользовать связанные объекты прошлого запроса
+        self.client.force_authenticate(User.objects.get(pk=user.pk) if user else None)
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url, data, **extra)
+            content = b''.join(response.streaming_content) if response.streaming else response.content
+        self.client.force_authenticate(None)
+        return response, len(queries), len(content)
+
+    def assertBudget(self, method, url, max_queries, max_size=None, user=None, data=None, paged=False,
+                     status=200, prepare=None, **extra):
+        """
+        Проверяем запрос на всех объемах данных из scales.
+        prepare(scale) готовит данные для изменяющих запросов и может вернуть data.
+        paged - ответ постраничный, и его размер не должен расти вместе с данными
+        """
+        measured = []
+        for scale in self.scales:
+            self.seed(scale)
+            payload = prepare(scale) if prepare else data
+            response, queries, size = self.call(method, url, user=user, data=payload, **extra)
+            self.assertEqual(response.status_code, status, f'{method.upper()} {url}')
+            if not response.streaming and response.get('Content-Type', '').startswith('application/json'):
+                body = json.loads(response.content)
+                if isinstance(body, dict) and 'Status' in body:
+                    self.assertTrue(body['Status'], f'{method.upper()} {url}: {body}')
+            measured.append((scale, queries, size))
+
+        counts = {queries for _, queries, _ in measured}
+        self.assertEqual(len(counts), 1, f'{method.upper()} {url}: число запросов растет с данными {measured}')
+        self.assertLessEqual(counts.pop(), max_queries, f'{method.upper()} {url}: {measured}')
+        if max_size is not None:
+            self.assertLessEqual(measured[-1][2], max_size, f'{method.upper()} {url}: {measured}')
+        if paged:
+            self.assertLessEqual(measured[-1][2], measured[0][2] * 1.2, f'{method.upper()} {url}: {measured}')
+        return measured
+
+
+class ShopsQueryBudgetTest(QueryBudgetTestCase):
+    """
+    Бюджет запросов для каталога, магазинов и импорта
+    """
+    def test_api_root(self):
+        self.assertBudget('get', '/api/v1/', 0, max_size=200)
+
+    def test_shop_list(self):
+        self.assertBudget('get', '/api/v1/shop/', 2, max_size=2500, user=self.buyer, paged=True)
+
+    def test_shop_detail(self):
+        shop = Shop.objects.create(name='Магазин', feed_etag='"etag"', feed_hash='hash')
+        self.assertBudget('get', f'/api/v1/shop/{shop.id}/', 1, max_size=300, user=self.buyer)
+        response, _, _ = self.call('get', f'/api/v1/shop/{shop.id}/', user=self.buyer)
+        self.assertFalse({'feed_etag', 'feed_last_modified', 'feed_hash'} & set(json.loads(response.content)))
+
+    def test_category_detail(self):
+        category = Category.objects.create(name='Категория')
+        self.assertBudget('get', f'/api/v1/category/{category.id}/', 2, max_size=300, user=self.buyer)
+
+    def test_category_list(self):
+        self.assertBudget('get', '/api/v1/category/', 3, max_size=1000, user=self.buyer, paged=True)
+
+    def test_products(self):
+        self.assertBudget('get', '/api/v1/products', 2, max_size=8000, user=self.buyer, paged=True)
+
+    def test_products_filtered(self):
+        self.assertBudget('get', '/api/v1/products?category_id=224&price_min=1000&in_stock=true&ordering=-price',
+                          2, max_size=8000, user=self.buyer, paged=True)
+
+    def test_products_search(self):
+        measured = self.assertBudget('get', '/api/v1/products', 2, max_size=8000, user=self.buyer,
+                                     data={'q': 'iphone'})
+        self.assertGreater(measured[-1][2], 200, 'поиск ничего не нашел')
+
+    def test_products_param_filters(self):
+        data = {'param[Цвет]': 'черный', 'param[Встроенная память (Гб)]': '32..'}
+        measured = self.assertBudget('get', '/api/v1/products', 2, max_size=8000, user=self.buyer, data=data)
+        self.assertGreater(measured[-1][2], 200, 'фильтр по параметрам ничего не нашел')
+
+    def test_products_price_filter_facets(self):
+        # счетчики фасетов считаются по тем же предложениям, что и результаты
+        self.seed(self.scales[0])
+        prices = sorted(ProductInfo.objects.values_list('price', flat=True))
+        response, _, _ = self.call('get', f'/api/v1/products?price_min={prices[-3]}', user=self.buyer)
+        body = json.loads(response.content)
+        self.assertEqual(len(body['results']), 3)
+        for values in body['facets'].values():
+            self.assertLessEqual(sum(values.values()), 3)
+
+    def test_products_sparse_fields(self):
+        self.assertBudget('get', '/api/v1/products?fields=name,price,shop', 2, max_size=2500, user=self.buyer,
+                          paged=True)
+
+    def test_export(self):
+        # выгрузка отдает весь каталог, поэтому ограничено только число запросов
+        self.assertBudget('get', '/api/v1/export?type=csv', 1, user=self.buyer)
+        self.assertBudget('get', '/api/v1/export?type=jsonl', 1, user=self.buyer, HTTP_ACCEPT_ENCODING='gzip')
+
+    def test_partner_state(self):
+        self.assertBudget('get', '/api/v1/partner/state', 1, max_size=600, user=self.partner)
+        self.assertBudget('post', '/api/v1/partner/state', 4, max_size=50, user=self.partner, data={'state': 'on'})
+
+    def test_partner_update(self):
+        def prepare(scale):
+            ImportJob.objects.all().delete()
+            return {'url': 'https://example.com/shop.yaml'}
+
+        self.assertBudget('post', '/api/v1/partner/update', 4, max_size=100, user=self.partner, prepare=prepare)
+        self.assertBudget('get', '/api/v1/partner/update', 1, max_size=400, user=self.partner)
+
+    def test_partner_upload_during_import(self):
+        job = ImportJob.objects.create(user=self.partner, url='https://example.com/shop.yaml', state='importing')
+        with TemporaryDirectory() as directory, patch('shops.feeds.UPLOAD_DIR', Path(directory)):
+            upload = SimpleUploadedFile('shop.jsonl', make_feed(write_jsonl, 'Магазин', generate_goods(5)).read())
+            response, _, _ = self.call('post', '/api/v1/partner/update', user=self.partner, data={'file': upload})
+            self.assertEqual((response.json()['Job'], response.json()['Created']), (job.id, False))
+            # файл отклоненной загрузки удален
+            self.assertEqual(list(Path(directory).iterdir()), [])
+
+    def test_cache_stats(self):
+        User.objects.filter(id=self.buyer.id).update(is_staff=True)
+        self.buyer.refresh_from_db()
+        self.assertBudget('get', '/api/v1/cache/stats', 0, max_size=600, user=self.buyer)
+
+    def test_seed_is_realistic(self):
+        self.seed(self.scales[-1])
+        self.assertEqual(ProductInfo.objects.filter(shop__user=self.partner).count(), self.scales[-1])
+        self.assertEqual(OrderItem.objects.filter(order__user=self.buyer, order__state='basket').count(), self.items)
+        self.assertGreater(Category.objects.count(), self.scales[-1] // 2)
+
+
+class FeedResponse:
+    """
+    Ответ сервера с прайсом для подмены requests.get
+    """
+    def __init__(self, status_code, content=b'', headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.content), chunk_size):
+            yield self.content[start:start + chunk_size]
+
+
+def make_feed(writer, shop, goods):
+    """
+    Прайс в памяти, записанный writer из генератора
+    """
+    output = StringIO()
+    writer(output, shop, goods)
+    return BytesIO(output.getvalue().encode())
+
+
+class CatalogTest(QueryBudgetTestCase):
+    """
+    Поиск, фильтры, фасеты, постраничный вывод и выгрузка каталога
+    """
+    def setUp(self):
+        super().setUp()
+        self.seed(self.scales[0])
+
+    def get(self, url, **extra):
+        response, _, _ = self.call('get', url, user=self.buyer, **extra)
+        return response
+
+    def test_cursor_traversal(self):
+        # одинаковые цены проверяют дозаполнение страницы по ключу курсора
+        ids = list(CatalogEntry.objects.order_by('pk').values_list('pk', flat=True))
+        CatalogEntry.objects.filter(pk__in=ids[::3]).update(price=1000)
+        orderings = {None: ('pk',), 'price': ('price', 'pk'), '-price': ('-price', '-pk'), 'name': ('name', 'pk')}
+        for ordering, order_by in orderings.items():
+            params = {'page_size': 7, 'fields': 'name,price'}
+            if ordering:
+                params['ordering'] = ordering
+            expected = list(CatalogEntry.objects.order_by(*order_by).values_list('pk', flat=True))
+
+            url, pages = f'/api/v1/products?{urlencode(params)}', []
+            while url:
+                body = self.get(url).json()
+                pages.append(body)
+                url = body['next']
+                self.assertLess(len(pages), 100, ordering)
+            self.assertEqual([item['id'] for body in pages for item in body['results']], expected, ordering)
+            self.assertEqual([len(body['results']) for body in pages[:-1]], [7] * (len(pages) - 1), ordering)
+
+            # назад от последней страницы по ссылкам previous
+            url, backward = pages[-1]['previous'], [item['id'] for item in pages[-1]['results']]
+            while url:
+                body = self.get(url).json()
+                backward = [item['id'] for item in body['results']] + backward
+                url = body['previous']
+            self.assertEqual(backward, expected, ordering)
+
+    def test_cursor_traversal_search(self):
+        url, found = '/api/v1/products?q=apple&page_size=2', []
+        while url:
+            body = self.get(url).json()
+            found.extend(item['id'] for item in body['results'])
+            url = body['next']
+        expected = set(CatalogEntry.objects.filter(product_name__icontains='apple').values_list('pk', flat=True))
+        self.assertEqual((len(found), set(found)), (len(expected), expected))
+
+    def test_invalid_cursor(self):
+        def cursor(position):
+            return b64encode(urlencode({'p': position}).encode()).decode()
+
+        for query in ('cursor=garbage', f'cursor={cursor("[1")}', f'cursor={cursor("[1, 2]")}',
+                      f'ordering=price&cursor={cursor(json.dumps(["дорого", 1]))}'):
+            response = self.get(f'/api/v1/products?{query}')
+            self.assertEqual(response.status_code, 400, query)
+
+
+    def facets(self, query):
+        """
+        Фасеты ответа и то, читались ли для них строки параметров
+        """
+        self.client.force_authenticate(self.buyer)
+        with CaptureQueriesContext(connection) as queries:
+            body = self.client.get(f'/api/v1/products?{query}').json()
+        self.client.force_authenticate(None)
+        grouped = any(ProductParameter._meta.db_table in item['sql'] and 'GROUP BY' in item['sql']
+                      for item in queries.captured_queries)
+        return body['facets'], grouped
+
+    def expected_facets(self, entries):
+        facets = {}
+        for name, value in ProductParameter.objects.filter(product_info__in=entries.values('pk')).values_list(
+                'parameter__name', 'value'):
+            facets.setdefault(name, {}).setdefault(value, 0)
+            facets[name][value] += 1
+        return facets
+
+    def test_facets(self):
+        ids = list(ProductInfo.objects.order_by('id').values_list('id', flat=True))
+        ProductInfo.objects.filter(id__in=ids[::4]).update(quantity=0)
+        refresh_catalog(ids)
+        for shop_id in Shop.objects.values_list('id', flat=True):
+            refresh_facets(shop_id)
+        entries = CatalogEntry.objects.filter(category_id=224)
+
+        # магазин, категория и наличие - из таблицы фасетов
+        for query, selected in (('category_id=224', entries),
+                                ('category_id=224&in_stock=true', entries.filter(quantity__gt=0))):
+            facets, grouped = self.facets(query)
+            self.assertEqual(facets, self.expected_facets(selected), query)
+            self.assertFalse(grouped, query)
+
+        # цена и параметры сужают выборку: счетчики группируются по отобранным предложениям
+        price = sorted(entries.values_list('price', flat=True))[len(entries) // 2]
+        for query, selected in ((f'category_id=224&in_stock=true&price_min={price}',
+                                 entries.filter(quantity__gt=0, price__gte=price)),
+                                ('category_id=224&param[Цвет]=черный',
+                                 entries.filter(pk__in=ProductParameter.objects.filter(
+                                     parameter__name='Цвет', value='черный').values('product_info')))):
+            facets, grouped = self.facets(query)
+            self.assertEqual(facets, self.expected_facets(selected), query)
+            self.assertTrue(grouped, query)
+
+    def ids(self, query):
+        url, found = f'/api/v1/products?{query}&page_size=100&fields=name', []
+        while url:
+            body = self.get(url).json()
+            found.extend(item['id'] for item in body['results'])
+            url = body['next']
+        return sorted(found)
+
+    def having(self, name, condition):
+        return set(ProductParameter.objects.filter(condition, parameter__name=name).values_list(
+            'product_info_id', flat=True))
+
+    def test_param_filters(self):
+        # значения одного параметра - через ИЛИ, разные параметры - через И
+        colors = self.having('Цвет', Q(value__in=['черный', 'белый', 'синий']))
+        memory = self.having('Встроенная память (Гб)', Q(value='16'))
+        self.assertTrue(colors & memory)
+        query = urlencode([('param[Цвет]', 'черный'), ('param[Цвет]', 'белый'), ('param[Цвет]', 'синий'),
+                           ('param[Встроенная память (Гб)]', '16')])
+        self.assertEqual(self.ids(query), sorted(colors & memory))
+
+        facets = self.get(f'/api/v1/products?{query}').json()['facets']
+        self.assertEqual(sum(facets['Цвет'].values()), len(colors & memory))
+        self.assertEqual(facets['Встроенная память (Гб)'], {'16': len(colors & memory)})
+        self.assertEqual(self.ids('param[Цвет]=фиолетовый'), [])
+
+    def test_parse_param_filters(self):
+        query = QueryDict('param[Цвет]=красный&param[Цвет]=синий&param[Цвет]=&param[Память (Гб)]>=256'
+                          '&param[Диагональ (дюйм)]<=6,5&param[]=1&price_min=10')
+        self.assertEqual(parse_param_filters(query), {'Цвет': ['красный', 'синий'], 'Память (Гб)': ['>=256'],
+                                                      'Диагональ (дюйм)': ['<=6,5']})
+
+    def test_value_condition(self):
+        parameters = ProductParameter.objects.filter(parameter__name='Встроенная память (Гб)')
+        values = {row['value_number'] for row in parameters.values('value_number')}
+        cases = {'32..128': lambda number: 32 <= number <= 128, '256..': lambda number: number >= 256,
+                 '..64': lambda number: number <= 64, '>=128': lambda number: number >= 128,
+                 '<128': lambda number: number < 128, '>16': lambda number: number > 16,
+                 '16,0..32,0': lambda number: 16 <= number <= 32}
+        for value, check in cases.items():
+            self.assertEqual(set(parameters.filter(value_condition(value)).values_list('value_number', flat=True)),
+                             {number for number in values if check(number)}, value)
+        # не диапазон - точное совпадение текста
+        self.assertEqual(value_condition('черный'), Q(value='черный'))
+        self.assertEqual(value_condition('..'), Q(value='..'))
+
+    def test_range_filters(self):
+        memory = ProductParameter.objects.filter(parameter__name='Встроенная память (Гб)')
+        for query, condition in ((urlencode({'param[Встроенная память (Гб)]': '64..256'}),
+                                  Q(value_number__gte=64, value_number__lte=256)),
+                                 (urlencode({'param[Встроенная память (Гб)]>': '128'}), Q(value_number__gte=128)),
+                                 (urlencode({'param[Встроенная память (Гб)]': '<64'}), Q(value_number__lt=64))):
+            expected = sorted(memory.filter(condition).values_list('product_info_id', flat=True))
+            self.assertTrue(expected, query)
+            self.assertEqual(self.ids(query), expected, query)
+
+    def export(self, query, compress=False):
+        extra = {'HTTP_ACCEPT_ENCODING': 'gzip'} if compress else {}
+        self.client.force_authenticate(self.buyer)
+        response = self.client.get(f'/api/v1/export?{query}', **extra)
+        self.client.force_authenticate(None)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response.get('Content-Encoding'), 'gzip' if compress else None)
+        content = b''.join(response.streaming_content)
+        return (gzip.decompress(content) if compress else content).decode()
+
+    def test_export_jsonl(self):
+        shop = Shop.objects.get(name='Тестовый магазин')
+        entries = CatalogEntry.objects.filter(shop=shop).order_by('pk')
+        expected = [{'id': entry.pk, 'product': {'id': entry.product_id, 'category': entry.category_name,
+                                                 'name': entry.product_name},
+                     'product_parameters': entry.parameters, 'external_id': entry.external_id, 'name': entry.name,
+                     'quantity': entry.quantity, 'price': f'{entry.price:.2f}', 'price_rrc': f'{entry.price_rrc:.2f}',
+                     'shop': shop.id} for entry in entries]
+        for compress in (False, True):
+            lines = self.export(f'type=jsonl&shop_id={shop.id}', compress).splitlines()
+            self.assertEqual([json.loads(line) for line in lines], expected, compress)
+            # строки выгрузки совпадают с выдачей /products
+            first = self.get(f'/api/v1/products?shop_id={shop.id}&page_size=1').json()['results'][0]
+            self.assertEqual(json.loads(lines[0]), first)
+
+    def test_export_csv(self):
+        entries = CatalogEntry.objects.filter(category_id=224).order_by('pk')
+        for compress in (False, True):
+            rows = list(csv.reader(StringIO(self.export('type=csv&category_id=224', compress))))
+            self.assertEqual(rows[0], ['id', 'shop_id', 'shop', 'category_id', 'category', 'product_id', 'product',
+                                       'external_id', 'name', 'quantity', 'price', 'price_rrc', 'parameters'])
+            self.assertEqual(rows[1:], [[str(value) for value in (
+                entry.pk, entry.shop_id, entry.shop_name, entry.category_id, entry.category_name, entry.product_id,
+                entry.product_name, entry.external_id, entry.name, entry.quantity, f'{entry.price:.2f}',
+                f'{entry.price_rrc:.2f}', json.dumps(entry.parameters, ensure_ascii=False))] for entry in entries])
+
+        self.assertEqual(self.get('/api/v1/export?type=xml').json()['Status'], False)
+
+    def test_export_command(self):
+        with TemporaryDirectory() as directory:
+            path = Path(directory) / 'catalog.jsonl.gz'
+            call_command('export_catalog', str(path), '--gzip', '--chunk-size', '7', stderr=StringIO())
+            lines = gzip.decompress(path.read_bytes()).decode().splitlines()
+        self.assertEqual([json.loads(line)['id'] for line in lines],
+                         list(CatalogEntry.objects.order_by('pk').values_list('pk', flat=True)))
+
+@override_settings(CACHES=TEST_CACHES)
+class ImportTest(TestCase):
+    """
+    Импорт прайсов: повторный импорт, пропуск неизмененных прайсов и форматы
+    """
+    def offers(self):
+        return dict(ProductInfo.objects.values_list('external_id', 'id'))
+
+    def test_reimport_same_feed_writes_nothing(self):
+        goods = list(generate_goods(20))
+        import_feed(make_feed(write_jsonl, 'Магазин', goods), filename='shop.jsonl')
+        offers = self.offers()
+
+        with CaptureQueriesContext(connection) as queries:
+            stats = import_feed(make_feed(write_jsonl, 'Магазин', goods), filename='shop.jsonl')
+        self.assertEqual((stats['created'], stats['updated'], stats['unchanged'], stats['deleted']), (0, 0, 20, 0))
+        self.assertEqual(self.offers(), offers)
+        tables = [model._meta.db_table for model in (ProductInfo, ProductParameter, CatalogEntry)]
+        writes = [query['sql'] for query in queries.captured_queries
+                  if query['sql'].split(' ', 1)[0] in ('INSERT', 'UPDATE', 'DELETE')
+                  and any(table in query['sql'] for table in tables)]
+        self.assertEqual(writes, [])
+
+    def test_reimport_changed_feed(self):
+        goods = list(generate_goods(20))
+        import_feed(make_feed(write_jsonl, 'Магазин', goods), filename='shop.jsonl')
+        offers = self.offers()
+        user = User.objects.create_user('buyer@example.com', 'Buyer-pass-123', is_active=True)
+        order = Order.objects.create(user=user, state='new')
+        OrderItem.objects.bulk_create([OrderItem(order=order, product_info_id=offers[external_id])
+                                       for external_id in (1, 2, 3)])
+        Order.objects.filter(id=order.id).refresh_totals()
+        order.refresh_from_db()
+        lines = list(order.order_items.order_by('id').values_list('id', 'product_info_id'))
+
+        # товар 2 пропал, у товара 3 новая цена, у товара 4 другие параметры, товары 21 и 22 новые
+        del goods[1]
+        goods[1]['price'] += 1
+        goods[2]['parameters'] = {'Цвет': 'фиолетовый'}
+        goods.extend(generate_goods(2, seed=1, start_id=21))
+        with patch.object(QuerySet, 'bulk_update', autospec=True, side_effect=QuerySet.bulk_update) as bulk_update, \
+                patch('shops.importer.refresh_catalog', wraps=refresh_catalog) as refresh:
+            stats = import_feed(make_feed(write_jsonl, 'Магазин', goods), filename='shop.jsonl')
+
+        self.assertEqual((stats['created'], stats['updated'], stats['unchanged'], stats['deleted']), (2, 2, 17, 1))
+        # записываются только измененные строки, остальные предложения сохраняют свои id
+        updated = [product_info.id for call in bulk_update.call_args_list if call.args[0].model is ProductInfo
+                   for product_info in call.args[1]]
+        self.assertEqual(updated, [offers[3]])
+        current = self.offers()
+        self.assertEqual(sorted(id for call in refresh.call_args_list for id in call.args[0]),
+                         sorted([offers[3], offers[4], current[21], current[22]]))
+        self.assertEqual({external_id: current[external_id] for external_id in offers if external_id != 2},
+                         {external_id: id for external_id, id in offers.items() if external_id != 2})
+        self.assertEqual(set(ProductParameter.objects.filter(product_info_id=offers[4]).values_list(
+            'parameter__name', 'value')), {('Цвет', 'фиолетовый')})
+        self.assertEqual(CatalogEntry.objects.get(product_info_id=offers[3]).price, goods[1]['price'])
+
+        # пропавшее предложение снято с продажи, но позиции и итоги оформленного заказа не меняются
+        self.assertFalse(ProductInfo.objects.get(id=offers[2]).is_active)
+        self.assertFalse(CatalogEntry.objects.filter(product_info_id=offers[2]).exists())
+        self.assertEqual(parse_basket_items([{'product_info': offers[2]}])[1], [f'Предложение {offers[2]} не найдено'])
+        self.assertEqual(list(order.order_items.order_by('id').values_list('id', 'product_info_id')), lines)
+        placed = Order.objects.get(id=order.id)
+        self.assertEqual((placed.item_count, placed.total), (order.item_count, order.total))
+
+        # вернувшийся в прайс товар снова продается под тем же id
+        goods.insert(1, list(generate_goods(2))[1])
+        stats = import_feed(make_feed(write_jsonl, 'Магазин', goods), filename='shop.jsonl')
+        self.assertEqual((stats['created'], stats['updated'], stats['deleted']), (0, 1, 0))
+        self.assertTrue(ProductInfo.objects.get(id=offers[2]).is_active)
+        self.assertTrue(CatalogEntry.objects.filter(product_info_id=offers[2]).exists())
+
+    def test_formats_import_same_goods(self):
+        formats = [feed_format for feed_format in FORMATS if feed_format != 'msgpack' or msgpack is not None]
+        with TemporaryDirectory() as directory:
+            for feed_format in formats:
+                path = write_feed(Path(directory) / f'shop{EXTENSIONS[feed_format]}', 50, shop=feed_format,
+                                  feed_format=feed_format)
+                with open(path, 'rb') as stream:
+                    import_feed(stream, filename=path.name)
+
+        goods = {}
+        for feed_format in formats:
+            offers = ProductInfo.objects.filter(shop__name=feed_format).order_by('external_id')
+            parameters = ProductParameter.objects.filter(product_info__shop__name=feed_format).order_by(
+                'product_info__external_id', 'parameter__name')
+            goods[feed_format] = (
+                list(offers.values_list('external_id', 'product__name', 'product__category__name', 'name', 'price',
+                                        'price_rrc', 'quantity')),
+                list(parameters.values_list('product_info__external_id', 'parameter__name', 'value', 'value_number')))
+        self.assertEqual(len(goods['yaml'][0]), 50)
+        for feed_format in formats:
+            self.assertEqual(goods[feed_format], goods['yaml'], feed_format)
+
+    def test_csv_without_category_names_keeps_names(self):
+        import_feed(make_feed(write_jsonl, 'Магазин', generate_goods(20)), filename='shop.jsonl')
+        names = dict(Category.objects.values_list('id', 'name'))
+
+        output = StringIO()
+        write_csv(output, 'Магазин', generate_goods(20))
+        rows = list(csv.DictReader(StringIO(output.getvalue())))
+        columns = [column for column in rows[0] if column != 'category_name']
+        output = StringIO()
+        writer = csv.DictWriter(output, columns, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(rows)
+        import_feed(BytesIO(output.getvalue().encode()), filename='shop.csv')
+
+        self.assertEqual(dict(Category.objects.values_list('id', 'name')), names)
+        self.assertFalse(CatalogEntry.objects.filter(category_name='').exists())
+
+    def test_csv_without_category_names_rejects_new_categories(self):
+        output = StringIO()
+        output.write('shop,category,id,model,name,price,price_rrc,quantity\n'
+                     'Магазин,224,1,apple/iphone-xr,Apple iPhone XR,100,110,1\n')
+        with self.assertRaises(ValueError):
+            import_feed(BytesIO(output.getvalue().encode()), filename='shop.csv')
+        self.assertFalse(Category.objects.exists())
+
+    def test_skip_unchanged_local_feed(self):
+        with TemporaryDirectory() as directory, patch('shops.feeds.LOCAL_ROOTS', [Path(directory)]):
+            path = Path(directory) / 'shop.yaml'
+            write_feed(path, 20, shop='Магазин')
+            self.assertEqual(import_url(str(path))['created'], 20)
+
+            # файл не менялся: совпал ETag по времени изменения и размеру
+            self.assertEqual(import_url(str(path))['skipped'], 'not_modified')
+
+            # файл перезаписан тем же содержимым: совпал хеш
+            stat = path.stat()
+            os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+            self.assertEqual(import_url(str(path))['skipped'], 'unchanged')
+
+            write_feed(path, 21, shop='Магазин')
+            stats = import_url(str(path))
+            self.assertEqual((stats['skipped'], stats['created'], stats['unchanged']), ('', 1, 20))
+
+    def test_skip_not_modified_http_feed(self):
+        url = 'https://example.com/shop.jsonl'
+        content = make_feed(write_jsonl, 'Магазин', generate_goods(20)).getvalue()
+        headers = {'ETag': '"v1"', 'Last-Modified': 'Sat, 17 Oct 2026 10:00:00 GMT',
+                   'Content-Type': 'application/x-ndjson'}
+        with patch('shops.feeds.get', return_value=FeedResponse(200, content, headers)):
+            self.assertEqual(import_url(url)['created'], 20)
+
+        with patch('shops.feeds.get', return_value=FeedResponse(304)) as get:
+            self.assertEqual(import_url(url)['skipped'], 'not_modified')
+        # валидаторы прошлой загрузки отправлены серверу
+        self.assertEqual(get.call_args.kwargs['headers'], {'If-None-Match': '"v1"',
+                                                           'If-Modified-Since': headers['Last-Modified']})
+
+        # сервер не поддерживает условные запросы, но содержимое то же
+        with patch('shops.feeds.get', return_value=FeedResponse(200, content, {'ETag': '"v2"'})):
+            self.assertEqual(import_url(url)['skipped'], 'unchanged')
+        self.assertEqual(Shop.objects.get(name='Магазин').feed_etag, '"v2"')
+
+    def test_cache_outage_after_import(self):
+        import_feed(make_feed(write_jsonl, 'Магазин', generate_goods(20)), filename='shop.jsonl')
+        goods = list(generate_goods(20))
+        goods[0]['price'] += 1
+        with patch('shops.cache.get_cache') as get_cache, self.assertLogs('shops.cache', 'ERROR') as logs, \
+                self.captureOnCommitCallbacks(execute=True):
+            get_cache.return_value.incr.side_effect = ConnectionError
+            stats = import_feed(make_feed(write_jsonl, 'Магазин', goods), filename='shop.jsonl')
+        # импорт сохранен, а ошибка кэша только записана в лог
+        self.assertEqual(stats['updated'], 1)
+        self.assertTrue(logs.output)
+        self.assertEqual(ProductInfo.objects.get(external_id=1).price, goods[0]['price'])
+
+    @override_settings(CACHES={**TEST_CACHES, 'responses': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://127.0.0.1:1/0'}})
+    def test_cache_outage_on_read(self):
+        import_feed(make_feed(write_jsonl, 'Магазин', generate_goods(20)), filename='shop.jsonl')
+        # кэш ответов указывает на недоступный Redis: ответы считаются без кэша
+        for url, name in (('/api/v1/products', 'Смартфоны'), ('/api/v1/shop/', 'Магазин'),
+                          ('/api/v1/category/', 'Смартфоны')):
+            with self.assertLogs('shops.cache', 'ERROR'):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertIn(name, response.content.decode(), url)
+
+    def test_category_rename_resets_products_cache(self):
+        feed = make_feed(write_jsonl, 'Магазин', generate_goods(20))
+        import_feed(feed, filename='shop.jsonl')
+        generation = get_generation('products')
+
+        lines = feed.getvalue().decode().splitlines()
+        header = json.loads(lines[0])
+        header['categories'][0]['name'] = 'Телефоны'
+        with self.captureOnCommitCallbacks(execute=True):
+            stats = import_feed(BytesIO('\n'.join([json.dumps(header), *lines[1:]]).encode()), filename='shop.jsonl')
+        # товары не изменились, но записи каталога с названием категории - да
+        self.assertEqual(stats['unchanged'], 20)
+        self.assertGreater(get_generation('products'), generation)
+        self.assertEqual(set(CatalogEntry.objects.filter(category_id=header['categories'][0]['id']).values_list(
+            'category_name', flat=True)), {'Телефоны'})
+
+
+class ImportJobTest(TestCase):
+    """
+    Очередь импортов: один активный импорт на поставщика и перехват зависших задач
+    """
+    url = 'https://example.com/shop.yaml'
+
+    def setUp(self):
+        self.partner = User.objects.create_user('partner@example.com', 'Partner-pass-123', type='shop',
+                                                is_active=True)
+
+    def stale_job(self):
+        job, _ = start_import(self.partner.id, self.url)
+        ImportJob.objects.filter(id=job.id).update(state='importing',
+                                                   updated_at=timezone.now() - timedelta(seconds=2 * 60 * 60))
+        return job
+
+    def test_dedupe(self):
+        job, created = start_import(self.partner.id, self.url)
+        self.assertTrue(created)
+        self.assertEqual(start_import(self.partner.id, 'https://example.com/other.yaml'), (job, False))
+        self.assertEqual(ImportJob.objects.count(), 1)
+
+    def test_stale_job_takeover(self):
+        job = self.stale_job()
+        with patch('shops.tasks.do_import.AsyncResult', side_effect=ConnectionError):
+            new_job, created = start_import(self.partner.id, self.url)
+        self.assertTrue(created)
+        self.assertNotEqual(new_job.id, job.id)
+        job.refresh_from_db()
+        self.assertEqual(job.state, 'failed')
+
+    def test_live_job_not_taken_over(self):
+        # ImportJob не меняется до фиксации транзакции импорта, но воркер сообщает о прогрессе
+        job = self.stale_job()
+        with patch('shops.tasks.do_import.AsyncResult') as result:
+            result.return_value.info = {'goods': 100, 'heartbeat': time()}
+            self.assertEqual(start_import(self.partner.id, self.url), (job, False))
+            self.assertEqual(get_progress(ImportJob.objects.get(id=job.id)), {'goods': 100})
+        job.refresh_from_db()
+        self.assertEqual(job.state, 'importing')
+
+    def test_silent_job_taken_over(self):
+        job = self.stale_job()
+        with patch('shops.tasks.do_import.AsyncResult') as result:
+            result.return_value.info = {'goods': 100, 'heartbeat': time() - 2 * 60 * 60}
+            _, created = start_import(self.partner.id, self.url)
+        self.assertTrue(created)
+        job.refresh_from_db()
+        self.assertEqual(job.state, 'failed')
+
+
+class CountingView:
+    """
+    Представление, которое считает, сколько раз ответ был посчитан
+    """
+    def __init__(self):
+        self.calls = 0
+
+    @cached_response('products')
+    def get(self, request):
+        self.calls += 1
+        return Response({'calls': self.calls})
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ResponseCacheTest(TestCase):
+    """
+    Кэш ответов: поколения, single flight и вероятностное раннее обновление
+    """
+    def setUp(self):
+        get_cache().clear()
+        self.view = CountingView()
+        self.request = Request(APIRequestFactory().get('/api/v1/products', {'shop_id': 1}))
+
+    def get(self):
+        return self.view.get(self.request).data['calls']
+
+    def key(self):
+        return response_key('products', self.request)
+
+    def test_hit_and_generation(self):
+        self.assertEqual([self.get(), self.get()], [1, 1])
+        # сброс другого раздела ответ не трогает
+        bump_generation('shops')
+        self.assertEqual(self.get(), 1)
+        bump_generation('products')
+        self.assertEqual([self.get(), self.get()], [2, 2])
+        self.assertEqual({name: cache_stats()['products'][name] for name in ('hits', 'misses', 'generation')},
+                         {'hits': 3, 'misses': 2, 'generation': 2})
+
+    def test_lock_holder_serves_stale(self):
+        self.get()
+        bump_generation('products')
+        # новый ответ уже считает другой запрос: отдается прошлое значение
+        get_cache().add(f'{self.key()}:lock', 1)
+        self.assertEqual(self.get(), 1)
+        self.assertEqual((self.view.calls, cache_stats()['products']['stale']), (1, 1))
+
+    def test_waiter_gets_result(self):
+        key = self.key()
+        get_cache().add(f'{key}:lock', 1)
+        with patch('shops.cache.sleep', side_effect=lambda seconds: get_cache().set(key, {'data': {'calls': 7}})):
+            self.assertEqual(self.get(), 7)
+        self.assertEqual(self.view.calls, 0)
+
+    def test_waiter_timeout(self):
+        key = self.key()
+        get_cache().add(f'{key}:lock', 1)
+        with patch('shops.cache.sleep'), patch('shops.cache.monotonic', side_effect=[0, 1, 2]) as monotonic:
+            self.assertEqual(self.get(), 1)
+        # ждали до RESPONSE_CACHE_WAIT, посчитали и сохранили ответ сами, а чужую блокировку не сняли
+        self.assertEqual(monotonic.call_count, 3)
+        self.assertIsNotNone(get_cache().get(f'{key}:lock'))
+        self.assertEqual(get_cache().get(key)['data'], {'calls': 1})
+
+    def test_early_refresh(self):
+        entry = {'delta': 1.0, 'expires': 100.0}
+        with patch('shops.cache.random', return_value=0.0):
+            self.assertFalse(should_refresh(entry, 99.0))
+        # -ln(1 - 0.9) ~ 2.3 секунды расчета: запись обновляется заранее
+        with patch('shops.cache.random', return_value=0.9):
+            self.assertTrue(should_refresh(entry, 99.0))
+        self.assertTrue(should_refresh(entry, 100.0))
 
-# Create your tests here.
+        # запись истекает через секунду, а считалась секунду
+        get_cache().set(self.key(), {'data': {'calls': 0}, 'delta': 1.0, 'expires': time() + 1})
+        with patch('shops.cache.random', return_value=0.0):
+            self.assertEqual(self.get(), 0)
+        with patch('shops.cache.random', return_value=0.9):
+            self.assertEqual(self.get(), 1)
+        with patch('shops.cache.random', return_value=0.0):
+            self.assertEqual(self.get(), 1)
@@ -1,6 +1,7 @@
 from django.urls import path
 
-from shops.views import ShopView, CategoryView, ProductInfoView, PartnerUpdate, PartnerState
+from shops.views import ShopView, CategoryView, ProductInfoView, PartnerUpdate, PartnerState, CacheStats, \
+    CatalogExport
 from rest_framework.routers import DefaultRouter
 from django.urls import include
 
@@ -15,4 +16,6 @@ urlpatterns = [
     path('products', ProductInfoView.as_view(), name='products'),
     path('partner/update', PartnerUpdate.as_view(), name='partner-update'),
     path('partner/state', PartnerState.as_view(), name='partner-state'),
+    path('export', CatalogExport.as_view(), name='export'),
+    path('cache/stats', CacheStats.as_view(), name='cache-stats'),
 ]
@@ -2,25 +2,44 @@ from django.core.exceptions import ValidationError
 from rest_framework.views import APIView
 from django.db.models import Q
 from rest_framework.response import Response
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
 from django.core.validators import URLValidator
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
 from rest_framework.viewsets import ReadOnlyModelViewSet
 
+from decimal import Decimal, InvalidOperation
 from distutils.util import strtobool
-from requests import get
-from yaml import load as load_yaml, Loader
 
-from shops.models import Category, Shop, ProductInfo, Product, Parameter, ProductParameter
-from shops.serializers import CategorySerializer, ShopSerializer, ProductInfoSerializer
+from shops.cache import cache_stats, cached_response
+from shops.catalog import set_shop_state
+from shops.export import EXPORT_CONTENT_TYPES, EXPORT_FORMATS, export_chunks, export_queryset, gzip_chunks
+from shops.facets import count_facets, filter_by_params, parse_param_filters
+from shops.feeds import local_path, save_upload
+from shops.models import Category, Shop, CatalogEntry, ImportJob
+from shops.pagination import ProductInfoPagination
+from shops.search import search_catalog
+from shops.serializers import CategorySerializer, ShopSerializer, ImportJobSerializer, OFFER_OUTPUT, \
+    catalog_columns, parse_fieldset, serialize_catalog_rows
+from shops.tasks import start_import, get_progress
 
 
 class CategoryView(ReadOnlyModelViewSet):
     """
     Класс для просмотра категорий
     """
-    queryset = Category.objects.all()
+    # магазины категории читаются одним запросом на страницу, а не по запросу на категорию
+    queryset = Category.objects.prefetch_related('shops')
     serializer_class = CategorySerializer
 
+    @cached_response('categories')
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cached_response('categories')
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
 
 class ShopView(ReadOnlyModelViewSet):
     """
@@ -29,32 +48,120 @@ class ShopView(ReadOnlyModelViewSet):
     queryset = Shop.objects.all()
     serializer_class = ShopSerializer
 
+    @cached_response('shops')
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cached_response('shops')
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
 
 class ProductInfoView(APIView):
     """
     Класс для поиска товаров
     """
+    @cached_response('products')
     def get(self, request, *args, **kwargs):
 
         query = Q()
         shop_id = request.query_params.get('shop_id')
         category_id = request.query_params.get('category_id')
+        text = request.query_params.get('q')
+        param_filters = parse_param_filters(request.query_params)
+        price_min = request.query_params.get('price_min')
+        price_max = request.query_params.get('price_max')
+        in_stock = request.query_params.get('in_stock')
+        ordering = request.query_params.get('ordering')
 
         if shop_id:
             query = query & Q(shop_id=shop_id)
 
         if category_id:
-            query = query & Q(product__category_id=category_id)
+            query = query & Q(category_id=category_id)
+
+        try:
+            if price_min:
+                query = query & Q(price__gte=Decimal(price_min))
+            if price_max:
+                query = query & Q(price__lte=Decimal(price_max))
+            in_stock = bool(in_stock and strtobool(in_stock))
+            if in_stock:
+                query = query & Q(quantity__gt=0)
+        except (InvalidOperation, ValueError):
+            return JsonResponse({'Status': False, 'Errors': 'Неправильно указаны аргументы'})
+
+        if ordering and ordering not in ProductInfoPagination.orderings:
+            return JsonResponse({'Status': False, 'Errors': 'Неправильно указан порядок сортировки'})
+
+        try:
+            fields, expand = parse_fieldset(request.query_params, tuple(OFFER_OUTPUT))
+        except ValueError as error:
+            return JsonResponse({'Status': False, 'Errors': str(error)})
+
+        # читаем плоскую таблицу каталога без join'ов и prefetch
+        queryset = filter_by_params(CatalogEntry.objects.filter(query), param_filters)
+
+        paginator = ProductInfoPagination()
+        # полнотекстовый поиск, результаты упорядочены по релевантности
+        if text:
+            queryset = search_catalog(queryset, text)
+            paginator.ordering = ('-rank', 'pk')
+        if ordering:
+            paginator.ordering = paginator.orderings[ordering]
+        # страница читается через values() только с нужными колонками
+        # и собирается в словари без DRF-сериализатора
+        columns = catalog_columns(fields, expand)
+        columns += tuple(field.lstrip('-') for field in paginator.ordering if field.lstrip('-') not in columns)
+        page = paginator.paginate_queryset(queryset.values(*columns), request, view=self)
+
+        response = paginator.get_paginated_response(serialize_catalog_rows(page, fields, expand))
+        # предрассчитанные счетчики подходят, только если выборка задана магазином, категорией и наличием
+        narrowed = bool(text or param_filters or price_min or price_max)
+        response.data['facets'] = count_facets(queryset, shop_id=shop_id, category_id=category_id,
+                                               in_stock=in_stock, narrowed=narrowed)
+        return response
+
+
+class CatalogExport(APIView):
+    """
+    Класс для потоковой выгрузки каталога в JSON Lines или CSV
+    """
+    def get(self, request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
+
+        # параметр format занят DRF под выбор рендерера
+        feed_format = request.query_params.get('type', 'jsonl')
+        if feed_format not in EXPORT_FORMATS:
+            return JsonResponse({'Status': False, 'Errors': 'Неправильно указан формат выгрузки'})
 
-        # фильтруем и отбрасываем дубликаты
-        queryset = ProductInfo.objects.filter(
-            query).select_related(
-            'shop', 'product__category').prefetch_related(
-            'product_parameters__parameter').distinct()
+        queryset = export_queryset(shop_id=request.query_params.get('shop_id'),
+                                   category_id=request.query_params.get('category_id'))
+        chunks = export_chunks(feed_format, queryset)
+        # сжимаем, если клиент принимает gzip
+        compress = 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+        response = StreamingHttpResponse(gzip_chunks(chunks) if compress else chunks,
+                                         content_type=EXPORT_CONTENT_TYPES[feed_format])
+        if compress:
+            response['Content-Encoding'] = 'gzip'
+        patch_vary_headers(response, ('Accept-Encoding',))
+        response['Content-Disposition'] = f'attachment; filename="catalog.{feed_format}"'
+        return response
 
-        serializer = ProductInfoSerializer(queryset, many=True)
 
-        return Response(serializer.data)
+class CacheStats(APIView):
+    """
+    Класс для просмотра статистики кэша ответов каталога
+    """
+    def get(self, request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
+
+        if not request.user.is_staff:
+            return JsonResponse({'Status': False, 'Error': 'Только для администраторов'}, status=403)
+
+        return Response(cache_stats())
 
 
 class PartnerState(APIView):
@@ -86,7 +193,7 @@ class PartnerState(APIView):
         state = request.data.get('state')
         if state:
             try:
-                Shop.objects.filter(user_id=request.user.id).update(state=strtobool(state))
+                set_shop_state(request.user.id, strtobool(state))
                 return JsonResponse({'Status': True})
             except ValueError as error:
                 return JsonResponse({'Status': False, 'Errors': str(error)})
@@ -98,6 +205,30 @@ class PartnerUpdate(APIView):
     """
     Класс для обновления прайса от поставщика
     """
+    # получить статус задачи импорта
+    def get(self, request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
+
+        if request.user.type != 'shop':
+            return JsonResponse({'Status': False, 'Error': 'Только для магазинов'}, status=403)
+
+        jobs = ImportJob.objects.filter(user_id=request.user.id)
+        job_id = request.query_params.get('job_id')
+        if job_id:
+            if not job_id.isdigit():
+                return JsonResponse({'Status': False, 'Errors': 'Неправильно указаны аргументы'})
+            jobs = jobs.filter(id=job_id)
+
+        job = jobs.first()
+        if not job:
+            return JsonResponse({'Status': False, 'Errors': 'Задача импорта не найдена'})
+
+        data = ImportJobSerializer(job).data
+        data.update(get_progress(job))
+        return Response(data)
+
+    # запустить импорт прайса по ссылке или из загруженного файла
     def post(self, request, *args, **kwargs):
         if not request.user.is_authenticated:
             return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
@@ -105,6 +236,17 @@ class PartnerUpdate(APIView):
         if request.user.type != 'shop':
             return JsonResponse({'Status': False, 'Error': 'Только для магазинов'}, status=403)
 
+        # загруженный файл пишется сразу на диск, а не собирается в памяти
+        request._request.upload_handlers = [TemporaryFileUploadHandler(request._request)]
+        upload = request.FILES.get('file')
+        if upload:
+            url = save_upload(upload)
+            job, created = start_import(request.user.id, url)
+            if not created:
+                # импорт уже идет, загруженный файл никто не прочитает
+                local_path(url).unlink(missing_ok=True)
+            return JsonResponse({'Status': True, 'Job': job.id, 'Created': created})
+
         url = request.data.get('url')
         if url:
             validate_url = URLValidator()
@@ -113,31 +255,7 @@ class PartnerUpdate(APIView):
             except ValidationError as e:
                 return JsonResponse({'Status': False, 'Error': str(e)})
             else:
-                stream = get(url).content
-
-                data = load_yaml(stream, Loader=Loader)
-
-                shop, _ = Shop.objects.get_or_create(name=data['shop'])
-                for category in data['categories']:
-                    category_object, _ = Category.objects.get_or_create(id=category['id'], name=category['name'])
-                    category_object.shops.add(shop.id)
-                    category_object.save()
-                ProductInfo.objects.filter(shop_id=shop.id).delete()
-                for item in data['goods']:
-                    product, _ = Product.objects.get_or_create(name=item['name'], category_id=item['category'])
-
-                    product_info = ProductInfo.objects.create(product_id=product.id,
-                                                              name=item['model'],
-                                                              price=item['price'],
-                                                              price_rrc=item['price_rrc'],
-                                                              quantity=item['quantity'],
-                                                              shop_id=shop.id)
-                    for name, value in item['parameters'].items():
-                        parameter_object, _ = Parameter.objects.get_or_create(name=name)
-                        ProductParameter.objects.create(product_info_id=product_info.id,
-                                                        parameter_id=parameter_object.id,
-                                                        value=value)
-
-                return JsonResponse({'Status': True})
+                job, created = start_import(request.user.id, url)
+                return JsonResponse({'Status': True, 'Job': job.id, 'Created': created})
 
         return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
@@ -1,3 +1,78 @@
-from django.test import TestCase
+from django_rest_passwordreset.models import ResetPasswordToken
+from rest_framework.authtoken.models import Token
 
-# Create your tests here.
+from shops.tests import QueryBudgetTestCase
+from users.models import ConfirmEmailToken, Contact, User
+
+
+class UsersQueryBudgetTest(QueryBudgetTestCase):
+    """
+    Бюджет запросов для регистрации, входа, контактов и данных пользователя
+    """
+    def test_register(self):
+        def prepare(scale):
+            return {'first_name': 'Иван', 'last_name': 'Иванов', 'email': f'new{scale}@example.com',
+                    'password': 'New-pass-123', 'company': 'ООО Ромашка', 'position': 'Менеджер'}
+
+        self.assertBudget('post', '/api/v1/user/register', 8, max_size=100, prepare=prepare, format='json')
+
+    def test_register_confirm(self):
+        def prepare(scale):
+            user = User.objects.create_user(f'confirm{scale}@example.com', 'Confirm-pass-123')
+            token = ConfirmEmailToken.objects.create(user=user)
+            return {'email': user.email, 'token': token.key}
+
+        self.assertBudget('post', '/api/v1/user/register/confirm', 4, max_size=100, prepare=prepare, format='json')
+
+    def test_login(self):
+        def prepare(scale):
+            Token.objects.filter(user=self.buyer).delete()
+            return {'email': self.buyer.email, 'password': 'Buyer-pass-123'}
+
+        self.assertBudget('post', '/api/v1/user/login', 5, max_size=100, prepare=prepare, format='json')
+
+    def test_details(self):
+        self.assertBudget('get', '/api/v1/user/details', 2, max_size=600, user=self.buyer)
+
+    def test_details_update(self):
+        self.assertBudget('post', '/api/v1/user/details', 1, max_size=100, user=self.buyer,
+                          data={'first_name': 'Петр', 'password': 'Other-pass-123'}, format='json')
+
+    def test_contacts(self):
+        self.assertBudget('get', '/api/v1/user/contact', 1, max_size=600, user=self.buyer)
+
+    def test_contact_create(self):
+        data = {'city': 'Москва', 'street': 'Арбат', 'house': '5', 'apartment': '12', 'phone': '+79000000002'}
+        self.assertBudget('post', '/api/v1/user/contact', 2, max_size=100, user=self.buyer, data=data,
+                          format='json')
+
+    def test_contact_update(self):
+        def prepare(scale):
+            return {'id': str(Contact.objects.filter(user=self.buyer).first().id), 'street': 'Арбат'}
+
+        self.assertBudget('put', '/api/v1/user/contact', 2, max_size=100, user=self.buyer, prepare=prepare,
+                          format='json')
+
+    def test_contact_delete(self):
+        def prepare(scale):
+            contact = Contact.objects.create(user=self.buyer, city='Москва', street='Арбат', house='7',
+                                             phone='+79000000003')
+            return {'items': str(contact.id)}
+
+        self.assertBudget('delete', '/api/v1/user/contact', 3, max_size=200, user=self.buyer, prepare=prepare,
+                          format='json')
+
+    def test_password_reset(self):
+        def prepare(scale):
+            ResetPasswordToken.objects.all().delete()
+            return {'email': self.buyer.email}
+
+        self.assertBudget('post', '/api/v1/user/password_reset', 4, max_size=100, prepare=prepare, format='json')
+
+    def test_password_reset_confirm(self):
+        def prepare(scale):
+            token = ResetPasswordToken.objects.create(user=self.buyer)
+            return {'token': token.key, 'password': f'Reset-pass-{scale}'}
+
+        self.assertBudget('post', '/api/v1/user/password_reset/confirm', 5, max_size=100, prepare=prepare,
+                          format='json')